@@ -52,16 +52,14 @@ class Weight_Training(nn.Module):
 def get_dataset(datapath, dataset_name, campaign_id):
     data_path = datapath + dataset_name + campaign_id
     train_data_file_name = 'train_.txt'
-    train_fm = pd.read_csv(data_path + train_data_file_name, header=None).values.astype(int)
+    train_fm = Data.load_encoded_data(data_path + train_data_file_name)
 
     test_data_file_name = 'test_.txt'
-    test_fm = pd.read_csv(data_path + test_data_file_name, header=None).values.astype(int)
+    test_fm = Data.load_encoded_data(data_path + test_data_file_name)
 
     field_nums = len(train_fm[0, 1:])  # 特征域的数量
 
-    feature_index_name = 'featindex.txt'
-    feature_index = pd.read_csv(data_path + feature_index_name, header=None).values
-    feature_nums = int(feature_index[-1, 0].split('\t')[1]) + 1 # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
     train_data = train_fm
     test_data = test_fm
@@ -73,12 +71,10 @@ def train(model, model_dict, optimizer, data_loader, loss, device):
     model.train()  # 转换为训练模式
     total_loss = 0
     log_intervals = 0
-    for i, (features, labels) in enumerate(tqdm.tqdm(data_loader, smoothing=0, mininterval=1.0)):
-        features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+    for i, (features, labels) in enumerate(tqdm.tqdm(Data.device_prefetcher(data_loader, device, report=True), smoothing=0, mininterval=1.0)):
+        labels = torch.unsqueeze(labels, 1)
 
-        pretrain_y_preds = torch.cat([
-            model_dict[l](features) for l in range(len(model_dict))
-        ], dim=1)
+        pretrain_y_preds = model_dict(features)
 
         weights = model(pretrain_y_preds)
 
@@ -102,12 +98,10 @@ def test(model, model_dict, data_loader, loss, device):
     intervals = 0
     total_test_loss = 0
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
 
-            pretrain_y_preds = torch.cat([
-                model_dict[l](features) for l in range(len(model_dict))
-            ], dim=1)
+            pretrain_y_preds = model_dict(features)
 
             weights = model(pretrain_y_preds)
 
@@ -126,11 +120,9 @@ def submission(model, model_dict, data_loader, device):
     model.eval()
     targets, predicts = list(), list()
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
-            pretrain_y_preds = torch.cat([
-                model_dict[l](features) for l in range(len(model_dict))
-            ], dim=1)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
+            pretrain_y_preds = model_dict(features)
 
             weights = model(pretrain_y_preds)
 
@@ -150,11 +142,8 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name, epoch, l
     device = torch.device(device)  # 指定运行设备
     train_fm, train_data, test_data, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id)
 
-    train_dataset = Data.libsvm_dataset(train_data[:, 1:], train_data[:, 0])
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
-
-    train_data_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, num_workers=8)
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    train_data_loader = Data.libsvm_batch_dataset(train_data[:, 1:], train_data[:, 0], batch_size=batch_size)
+    test_data_loader = Data.libsvm_batch_dataset(test_data[:, 1:], test_data[:, 0], batch_size=batch_size)
 
     FFM = p_model.FFM(feature_nums, field_nums, latent_dims)
     FFM_pretrain_params = torch.load(save_param_dir + campaign_id + 'FFMbest.pth')
@@ -209,6 +198,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name, epoch, l
     # model_dict = {0: LR.to(device), 1: FM.to(device), 2: FFM.to(device)}
     model_dict = {0: WandD.to(device), 1: FNN.to(device), 2: IPNN.to(device), 3: DCN.to(device), 4: AFM.to(device),
                   5: FFM.to(device)}
+    model_dict = p_model.FusedEnsemble(model_dict)
 
     model = Weight_Training(len(model_dict), len(model_dict)).to(device)
 
@@ -30,13 +30,11 @@ def get_dataset(datapath, dataset_name, campaign_id):
     data_path = datapath + dataset_name + campaign_id
 
     test_data_file_name = 'test_.txt'
-    test_fm = pd.read_csv(data_path + test_data_file_name, header=None).values.astype(int)
+    test_fm = Data.load_encoded_data(data_path + test_data_file_name)
 
     field_nums = len(test_fm[0, 1:])  # 特征域的数量
 
-    feature_index_name = 'featindex.txt'
-    feature_index = pd.read_csv(data_path + feature_index_name, header=None).values
-    feature_nums = int(feature_index[-1, 0].split('\t')[1]) + 1  # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
     test_data = test_fm
 
@@ -45,12 +43,11 @@ def get_dataset(datapath, dataset_name, campaign_id):
 
 def submission(model_dict, data_loader, device):
     targets, predicts = list(), list()
-    pretrain_model_len = len(model_dict)
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
 
-            pretrain_y_preds = torch.cat([model_dict[i](features) for i in range(pretrain_model_len)], dim=1).mean(dim=1).view(-1, 1)
+            pretrain_y_preds = model_dict(features).mean(dim=1).view(-1, 1)
 
             targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
             predicts.extend(pretrain_y_preds.tolist())
@@ -65,9 +62,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, batch_size, device,
     device = torch.device(device)  # 指定运行设备
     test_data, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id)
 
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
-
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    test_data_loader = Data.libsvm_batch_dataset(test_data[:, 1:], test_data[:, 0], batch_size=batch_size)
 
     # FFM = p_model.FFM(feature_nums, field_nums, latent_dims)
     # FFM_pretrain_params = torch.load(save_param_dir + campaign_id + 'FFMbest.pth')
@@ -121,6 +116,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, batch_size, device,
 
     # model_dict = {0: LR.to(device), 1: FM.to(device), 2: FFM.to(device)}
     model_dict = {0: WandD.to(device), 1: FNN.to(device), 2: IPNN.to(device), 3: DCN.to(device), 4: AFM.to(device)}
+    model_dict = p_model.FusedEnsemble(model_dict)
 
     submission_path = data_path + dataset_name + campaign_id + 'average_pretrain' + '/'  # ctr 预测结果存放文件夹位置
     if not os.path.exists(submission_path):
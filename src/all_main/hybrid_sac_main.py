@@ -37,16 +37,14 @@ def get_model(action_nums, feature_nums, field_nums, latent_dims, init_lr_a, ini
 def get_dataset(datapath, dataset_name, campaign_id):
     data_path = datapath + dataset_name + campaign_id
     train_data_file_name = 'train_.txt'
-    train_fm = pd.read_csv(data_path + train_data_file_name, header=None).values.astype(int)
+    train_fm = Data.load_encoded_data(data_path + train_data_file_name)
 
     test_data_file_name = 'test_.txt'
-    test_fm = pd.read_csv(data_path + test_data_file_name, header=None).values.astype(int)
+    test_fm = Data.load_encoded_data(data_path + test_data_file_name)
 
     field_nums = len(train_fm[0, 1:])  # 特征域的数量
 
-    feature_index_name = 'featindex.txt'
-    feature_index = pd.read_csv(data_path + feature_index_name, header=None).values
-    feature_nums = int(feature_index[-1, 0].split('\t')[1]) + 1  # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
     train_data = train_fm
     test_data = test_fm
@@ -62,9 +60,8 @@ def generate_preds(model_dict, features, actions, prob_weights,
 
     pretrain_model_len = len(model_dict)  # 有多少个预训练模型
 
-    pretrain_y_preds = {}
-    for i in range(pretrain_model_len):
-        pretrain_y_preds[i] = model_dict[i](features).detach()
+    ensemble_y_preds = model_dict(features)
+    pretrain_y_preds = {i: ensemble_y_preds[:, i: i + 1] for i in range(pretrain_model_len)}
 
     choose_model_lens = range(1, pretrain_model_len + 1)
     for i in choose_model_lens:  # 根据ddqn_model的action,判断要选择ensemble的数量
@@ -141,8 +138,8 @@ def train(rl_model, model_dict, data_loader, embedding_layer, exploration_rate,
     total_rewards = 0
     targets, predicts = list(), list()
 
-    for i, (features, labels) in enumerate(tqdm.tqdm(data_loader, smoothing=0, mininterval=1.0)):
-        features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+    for i, (features, labels) in enumerate(tqdm.tqdm(Data.device_prefetcher(data_loader, device, report=True), smoothing=0, mininterval=1.0)):
+        labels = torch.unsqueeze(labels, 1)
 
         embedding_vectors = embedding_layer.forward(features)
 
@@ -179,8 +176,8 @@ def test(rl_model, model_dict, embedding_layer, data_loader, loss, device):
     test_rewards = 0
 
     with torch.no_grad():
-        for i, (features, labels) in enumerate(data_loader):
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for i, (features, labels) in enumerate(Data.device_prefetcher(data_loader, device)):
+            labels = torch.unsqueeze(labels, 1)
 
             embedding_vectors = embedding_layer.forward(features)
 
@@ -205,8 +202,8 @@ def submission(rl_model, model_dict, embedding_layer, data_loader, device):
     final_actions = torch.LongTensor().to(device)
     final_prob_weights = torch.FloatTensor().to(device)
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
 
             embedding_vectors = embedding_layer.forward(features)
 
@@ -233,12 +230,8 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
     device = torch.device(device)  # 指定运行设备
     train_fm, train_data, test_data, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id)
 
-    train_dataset = Data.libsvm_dataset(train_data[:, 1:], train_data[:, 0])
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
-
-    train_data_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size,
-                                                    num_workers=8)  # 0.7153541503790021
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    train_data_loader = Data.libsvm_batch_dataset(train_data[:, 1:], train_data[:, 0], batch_size=batch_size)  # 0.7153541503790021
+    test_data_loader = Data.libsvm_batch_dataset(test_data[:, 1:], test_data[:, 0], batch_size=batch_size)
 
     FFM = p_model.FFM(feature_nums, field_nums, latent_dims)
     FFM_pretrain_params = torch.load(save_param_dir + campaign_id + 'FFMbest.pth')
@@ -291,6 +284,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
     # DCN.eval()
 
     model_dict = {0: LR.to(device), 1: FM.to(device), 2: FFM.to(device)}
+    model_dict = p_model.FusedEnsemble(model_dict)
     # model_dict = {0: WandD.to(device), 1: DeepFM.to(device), 2: IPNN.to(device), 3: DCN.to(device), 4: AFM.to(device)}
 
     model_dict_len = len(model_dict)
@@ -10,7 +10,6 @@ import src.models.p_model as p_model
 import src.models.v10_Hybrid_TD3_model_PER as td3_model
 import src.models.creat_data as Data
 from src.models.Feature_embedding import Feature_Embedding
-from itertools import islice
 
 import torch
 import torch.nn as nn
@@ -40,12 +39,10 @@ def get_dataset(datapath, dataset_name, campaign_id):
     data_path = datapath + dataset_name + campaign_id
 
     test_data_file_name = 'test_.txt'
-    test_fm = pd.read_csv(data_path + test_data_file_name, header=None).values.astype(int)
+    test_fm = Data.load_encoded_data(data_path + test_data_file_name)
     field_nums = len(test_fm[0, 1:])  # 特征域的数量
 
-    feature_index_name = 'featindex.txt'
-    feature_index = pd.read_csv(data_path + feature_index_name, header=None).values
-    feature_nums = int(feature_index[-1, 0].split('\t')[1]) + 1  # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
     test_data = test_fm
 
@@ -64,9 +61,8 @@ def generate_preds(model_dict, features, actions, prob_weights, c_actions,
 
     pretrain_model_len = len(model_dict)  # 有多少个预训练模型
 
-    pretrain_y_preds = {}
-    for i in range(pretrain_model_len):
-        pretrain_y_preds[i] = model_dict[i](features).detach()
+    ensemble_y_preds = model_dict(features)
+    pretrain_y_preds = {i: ensemble_y_preds[:, i: i + 1] for i in range(pretrain_model_len)}
 
     return_c_actions = torch.zeros(size=(len(features), len(model_dict))).to(device)
 
@@ -164,7 +160,7 @@ def generate_preds(model_dict, features, actions, prob_weights, c_actions,
     return y_preds, rewards, return_c_actions
 
 
-def test(rl_model, model_dict, embedding_layer, test_file, test_lens, device):
+def test(rl_model, model_dict, embedding_layer, test_dataset, device):
     targets, predicts = list(), list()
     intervals = 0
     total_test_loss = 0
@@ -172,35 +168,25 @@ def test(rl_model, model_dict, embedding_layer, test_file, test_lens, device):
     final_actions = torch.LongTensor().to(device)
     final_prob_weights = torch.FloatTensor().to(device)
     with torch.no_grad():
-        batch_iter_lens = 0
-        with open(test_file) as test_f:
-            for i in range(0, test_lens, 4096):
-                terminal_i = min(test_lens - batch_iter_lens, 4096)
+        for features, labels in Data.device_prefetcher(test_dataset, device):
+            labels = torch.unsqueeze(labels, 1)
 
-                lines = list(islice(test_f, 0, terminal_i)) # 获取迭代器结果的切片，需要注意的是它会消耗迭代器,也就是已迭代的数据会被丢弃
-                batch_iter_lens += 4096
-
-                items = torch.LongTensor(
-                    np.array(list(map(map_f, lines))).astype(int))  # map函数将list中每一个item都映射至function中
-
-                features, labels = items[:, 1:].to(device), torch.unsqueeze(items[:, 0], 1).to(device)
-
-                embedding_vectors = embedding_layer.forward(features)
+            embedding_vectors = embedding_layer.forward(features)
 
-                actions, c_actions, prob_weights = rl_model.choose_best_action(embedding_vectors)
-                # print(actions, prob_weights)
-                # print(torch.sum(prob_weights, dim=-1))
-                y, rewards, return_c_actions = generate_preds(model_dict, features, actions, prob_weights, c_actions,
-                                                              labels, device, mode='test')
+            actions, c_actions, prob_weights = rl_model.choose_best_action(embedding_vectors)
+            # print(actions, prob_weights)
+            # print(torch.sum(prob_weights, dim=-1))
+            y, rewards, return_c_actions = generate_preds(model_dict, features, actions, prob_weights, c_actions,
+                                                          labels, device, mode='test')
 
-                targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
-                predicts.extend(y.tolist())
-                intervals += 1
+            targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
+            predicts.extend(y.tolist())
+            intervals += 1
 
-                test_rewards = torch.cat([test_rewards, rewards], dim=0)
+            test_rewards = torch.cat([test_rewards, rewards], dim=0)
 
-                final_actions = torch.cat([final_actions, actions], dim=0)
-                final_prob_weights = torch.cat([final_prob_weights, prob_weights], dim=0)
+            final_actions = torch.cat([final_actions, actions], dim=0)
+            final_prob_weights = torch.cat([final_prob_weights, prob_weights], dim=0)
 
     return roc_auc_score(targets, predicts), predicts, test_rewards.mean().item(), final_actions, final_prob_weights
 
@@ -210,8 +196,8 @@ def submission(rl_model, model_dict, embedding_layer, data_loader, device):
     final_actions = torch.LongTensor().to(device)
     final_prob_weights = torch.FloatTensor().to(device)
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
 
             embedding_vectors = embedding_layer.forward(features)
 
@@ -228,12 +214,9 @@ def submission(rl_model, model_dict, embedding_layer, data_loader, device):
 
     return predicts, roc_auc_score(targets, predicts), final_actions.cpu().numpy(), final_prob_weights.cpu().numpy()
 
-def map_f(line):
-    return line.strip().split(',')
-
 def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
          init_lr_a, end_lr_a, init_lr_c, end_lr_c, init_exploration_rate, end_exploration_rate,
-         epoch, batch_size, device, save_param_dir):
+         epoch, batch_size, device, save_param_dir, shuffle_buffer=0, shuffle_seed=1):
     if not os.path.exists(save_param_dir):
         os.mkdir(save_param_dir)
 
@@ -241,21 +224,18 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
         os.mkdir(save_param_dir + campaign_id + model_name)
 
     device = torch.device(device)  # 指定运行设备
-    train_lens = 33689329
-    test_lens = 6739638
-
     train_file = data_path + dataset_name + campaign_id + 'train_.txt'
     test_file = data_path + dataset_name + campaign_id + 'test_.txt'
 
-    field_nums = 0
-    for i, line in enumerate(open(train_file, 'r')):
-        if i == 0:
-            field_nums = len(line.strip().split(',')) - 1
-            break
+    # 行数, 特征域数量与特征数量都从meta.json读取
+    train_lens = Data.load_rows(data_path + dataset_name + campaign_id, 'train_.txt')
+
+    field_nums = Data.load_field_nums(data_path + dataset_name + campaign_id, 'train_.txt')
 
-    feature_index_name = 'featindex.txt'
-    feature_index = pd.read_csv(data_path + dataset_name + campaign_id + feature_index_name, header=None).values
-    feature_nums = int(feature_index[-1, 0].split('\t')[1]) + 1  # 特征数量
+    feature_nums = Data.load_feature_nums(data_path + dataset_name + campaign_id)  # 特征数量
+
+    # 测试集只解析一次, 以int32张量常驻内存, 每次评估直接按batch切片
+    test_dataset = Data.load_eval_dataset(test_file, 4096, pin_memory=device.type == 'cuda')
 
     # FFM = p_model.FFM(feature_nums, field_nums, latent_dims)
     # FFM_pretrain_params = torch.load(save_param_dir + campaign_id + 'FFMbest.pth')
@@ -309,6 +289,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
 
     # model_dict = {0: LR.to(device), 1: FM.to(device), 2: FFM.to(device)}
     model_dict = {0: WandD.to(device), 1: FNN.to(device), 2: IPNN.to(device), 3: DCN.to(device), 4: FM.to(device)}
+    model_dict = p_model.FusedEnsemble(model_dict)
 
     model_dict_len = len(model_dict)
 
@@ -340,17 +321,13 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
 
         train_start_time = datetime.datetime.now()
 
-        batch_iter_lens = 0
-        with open(train_file) as train_f:
+        # 后台线程按大块解析训练数据, 与generate_preds和learn重叠; shuffle_buffer大于0时每轮用不同的种子在内存中打乱
+        with Data.libsvm_stream_reader(train_file, batch_size, shuffle_buffer=shuffle_buffer,
+                                       seed=shuffle_seed + epoch_i) as train_reader:
+            train_prefetcher = Data.device_prefetcher(train_reader, device)
+            train_batches = iter(train_prefetcher)
             for i in tqdm.tqdm(range(0, train_lens, batch_size), smoothing=0.0, mininterval=1.0):
-                terminal_i = min(train_lens - batch_iter_lens, batch_size)
-
-                lines = list(islice(train_f, 0, terminal_i)) # 获取迭代器结果的切片，需要注意的是它会消耗迭代器,也就是已迭代的数据会被丢弃
-                batch_iter_lens += batch_size
-
-                items = torch.LongTensor(np.array(list(map(map_f, lines))).astype(int)) # map函数将list中每一个item都映射至function中
-
-                features, labels = items[:, 1:].to(device), torch.unsqueeze(items[:, 0], 1).to(device)
+                features, labels = next(train_batches)
 
                 embedding_vectors = embedding_layer.forward(features)
 
@@ -376,7 +353,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
                     # #     if i <= (train_lens // batch_size) - 100:
                     if i // batch_size == 1000:
                         auc, predicts, test_rewards, actions, prob_weights = test(rl_model, model_dict, embedding_layer,
-                                                                                  test_file, test_lens,
+                                                                                  test_dataset,
                                                                                   device)
                         print('timesteps', i, 'test_auc', auc, 'test_rewards', test_rewards)
                         rewards_records.append(test_rewards)
@@ -389,7 +366,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
                         # torch.save(rl_model.Hybrid_Actor.state_dict(),
                         #            save_param_dir + campaign_id + model_name + '/' + str(i // batch_size) + '_' + '.pth')
                         auc, predicts, test_rewards, actions, prob_weights = test(rl_model, model_dict, embedding_layer,
-                                                                                  test_file, test_lens,
+                                                                                  test_dataset,
                                                                                   device)
                         print('timesteps', i, 'test_auc', auc, 'test_rewards', test_rewards)
                         rewards_records.append(test_rewards)
@@ -411,7 +388,7 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
 
                 if train_lens - i <= batch_size:
                     auc, predicts, test_rewards, actions, prob_weights = test(rl_model, model_dict, embedding_layer,
-                                                                              test_file, test_lens,
+                                                                              test_dataset,
                                                                               device)
                     print('timesteps', i, 'test_auc', auc, 'test_rewards', test_rewards)
                     rewards_records.append(test_rewards)
@@ -421,6 +398,8 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name,
                     torch.cuda.empty_cache()
 
         print(rl_model.temprature)
+        print('label mix', train_reader.label_mix())
+        print('input wait {:.2f}s'.format(train_prefetcher.wait_seconds))
         train_end_time = datetime.datetime.now()
 
         print('epoch:', epoch_i, 'test auc:', valid_aucs[-1], '[{}s]'.format((train_end_time - train_start_time).seconds))
@@ -479,6 +458,8 @@ if __name__ == '__main__':
     parser.add_argument('--weight_decay', type=float, default=1e-5)
     parser.add_argument('--early_stop_type', default='auc', help='auc, loss')
     parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--shuffle_buffer', type=int, default=0, help='训练时内存中打乱的缓冲行数, 0为按文件顺序读取')
+    parser.add_argument('--shuffle_seed', type=int, default=1)
     parser.add_argument('--device', default='cuda:0')
     parser.add_argument('--save_param_dir', default='../models/model_params/')
 
@@ -502,5 +483,7 @@ if __name__ == '__main__':
         args.epoch,
         args.batch_size,
         args.device,
-        args.save_param_dir
+        args.save_param_dir,
+        args.shuffle_buffer,
+        args.shuffle_seed
     )
\ No newline at end of file
@@ -29,6 +29,8 @@ def get_model(model_name, feature_nums, field_nums, latent_dims):
         return Model.FM(feature_nums, latent_dims)
     elif model_name == 'FFM':
         return Model.FFM(feature_nums, field_nums, latent_dims)
+    elif model_name == 'CompactFFM':
+        return Model.CompactFFM(feature_nums, field_nums, latent_dims)
     elif model_name == 'W&D':
         return Model.WideAndDeep(feature_nums, field_nums, latent_dims)
     elif model_name == 'DeepFM':
@@ -44,32 +46,34 @@ def get_model(model_name, feature_nums, field_nums, latent_dims):
     elif model_name == 'AFM':
         return Model.AFM(feature_nums, field_nums, latent_dims)
 
-def get_dataset(datapath, dataset_name, campaign_id):
+def get_dataset(datapath, dataset_name, campaign_id, neg_rate=1.0):
     data_path = datapath + dataset_name + campaign_id
     train_data_file_name = 'train_.txt'
-    train_fm = pd.read_csv(data_path + train_data_file_name, header=None).values.astype(int)
+    train_fm = Data.load_encoded_data(data_path + train_data_file_name)
 
     test_data_file_name = 'test_.txt'
-    test_fm = pd.read_csv(data_path + test_data_file_name, header=None).values.astype(int)
+    test_fm = Data.load_encoded_data(data_path + test_data_file_name)
 
     field_nums = len(train_fm[0, 1:])  # 特征域的数量
 
-    feature_index_name = 'featindex.txt'
-    feature_index = pd.read_csv(data_path + feature_index_name, header=None).values
-    feature_nums = int(feature_index[-1, 0].split('\t')[1]) + 1 # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
-    train_data = torch.LongTensor(train_fm)
+    # int32, embedding查表时才扩展; 降采样时得到的已经是只含保留行的新数组, 不再复制完整的train_fm
+    train_data = Data.downsample_train(train_fm, neg_rate)
+    if train_data is train_fm:
+        train_data = np.array(train_fm, dtype=np.int32)
+    train_data = torch.from_numpy(train_data)
     test_data = test_fm
 
     return train_fm, train_data, test_data, field_nums, feature_nums
 
 
-def train(model, optimizer, train_data, loss, device, len_train, batch):
+def train(model, optimizer, data_loader, loss, device):
     model.train()  # 转换为训练模式
     total_loss = 0
     log_intervals = 0
-    for i in tqdm.tqdm(range(0, len_train, batch), smoothing=0, mininterval=1.0):
-        features, labels = train_data[i:i+batch, 1:].to(device), train_data[i:i+batch, 0].unsqueeze(1).to(device)
+    for i, (features, labels) in enumerate(tqdm.tqdm(Data.device_prefetcher(data_loader, device, report=True), smoothing=0, mininterval=1.0)):
+        labels = torch.unsqueeze(labels, 1)
         y = model(features)
         train_loss = loss(y, labels.float())
 
@@ -83,15 +87,16 @@ def train(model, optimizer, train_data, loss, device, len_train, batch):
     return total_loss / log_intervals
 
 
-def test(model, data_loader, loss, device):
+def test(model, data_loader, loss, device, neg_rate=1.0):
     model.eval()
     targets, predicts = list(), list()
     intervals = 0
     total_test_loss = 0
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             y = model(features)
+            y = Data.calibrate_preds(y, neg_rate)
 
             test_loss = loss(y, labels.float())
             targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
@@ -106,8 +111,8 @@ def submission(model, data_loader, device):
     model.eval()
     targets, predicts = list(), list()
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             y = model(features)
 
             targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
@@ -117,18 +122,19 @@ def submission(model, data_loader, device):
 
 
 def main(data_path, dataset_name, campaign_id, latent_dims, model_name, epoch, learning_rate,
-         weight_decay, early_stop_type, batch_size, device, save_param_dir):
+         weight_decay, early_stop_type, batch_size, device, save_param_dir, neg_rate=1.0):
     if not os.path.exists(save_param_dir + campaign_id):
         os.mkdir(save_param_dir + campaign_id)
 
     device = torch.device(device)  # 指定运行设备
-    train_fm, train_data, test_data, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id)
+    train_fm, train_data, test_data, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id,
+                                                                            neg_rate)
 
     # train_dataset = Data.libsvm_dataset(train_data[:, 1:], train_data[:, 0])
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
 
     # train_data_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, num_workers=8)
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    train_data_loader = Data.libsvm_batch_dataset(train_data[:, 1:], train_data[:, 0], batch_size=batch_size)
+    test_data_loader = Data.libsvm_batch_dataset(test_data[:, 1:], test_data[:, 0], batch_size=batch_size)
 
     model = get_model(model_name, feature_nums, field_nums, latent_dims).to(device)
 
@@ -152,11 +158,11 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name, epoch, l
         # learning_rate += 1e-4
         optimizer = torch.optim.Adam(params=model.parameters(), lr=learning_rate, weight_decay=weight_decay)
 
-        train_average_loss = train(model, optimizer, train_data, loss, device, len(train_fm), batch_size)
+        train_average_loss = train(model, optimizer, train_data_loader, loss, device)
 
         torch.save(model.state_dict(), save_param_dir + campaign_id + model_name + str(np.mod(epoch_i, 5)) + '.pth')
 
-        auc, valid_loss = test(model, test_data_loader, loss, device)
+        auc, valid_loss = test(model, test_data_loader, loss, device, neg_rate)
         valid_aucs.append(auc)
         valid_losses.append(valid_loss)
 
@@ -179,6 +185,8 @@ def main(data_path, dataset_name, campaign_id, latent_dims, model_name, epoch, l
     else:
         test_model = model
 
+    Model.fold_calibration(test_model, neg_rate)
+
     auc, test_loss = test(test_model, test_data_loader, loss, device)
     torch.save(test_model.state_dict(), save_param_dir + campaign_id + model_name + 'best.pth')  # 存储最优参数
 
@@ -222,7 +230,7 @@ if __name__ == '__main__':
     parser.add_argument('--data_path', default='../../data/')
     parser.add_argument('--dataset_name', default='avazu/', help='ipinyou, cretio, yoyi, avazu')
     parser.add_argument('--campaign_id', default='avazu/', help='1458, 3358, 3386, 3427, 3476, avazu')
-    parser.add_argument('--model_name', default='IPNN', help='LR, FM, FFM, W&D, FNN, DeepFM, IPNN, OPNN, DCN, AFM')
+    parser.add_argument('--model_name', default='IPNN', help='LR, FM, FFM, CompactFFM, W&D, FNN, DeepFM, IPNN, OPNN, DCN, AFM')
     parser.add_argument('--latent_dims', default=10)
     parser.add_argument('--epoch', type=int, default=20)
     parser.add_argument('--learning_rate', type=float, default=1e-3)
@@ -231,6 +239,7 @@ if __name__ == '__main__':
     parser.add_argument('--batch_size', type=int, default=4096)
     parser.add_argument('--device', default='cuda:0')
     parser.add_argument('--save_param_dir', default='../models/model_params/')
+    parser.add_argument('--neg_rate', type=float, default=1.0, help='负样本降采样的保留比例, 1为不降采样')
 
     args = parser.parse_args()
 
@@ -249,5 +258,6 @@ if __name__ == '__main__':
         args.early_stop_type,
         args.batch_size,
         args.device,
-        args.save_param_dir
+        args.save_param_dir,
+        args.neg_rate
     )
\ No newline at end of file
@@ -4,16 +4,101 @@ import operator
 from csv import DictReader
 from datetime import datetime
 import argparse
-import pandas as pd
 import numpy as np
 import os
+import resource
+import shutil
+import tempfile
+from contextlib import ExitStack
+from itertools import islice
+from meta_data import update_meta, file_stats
+from to_shards import shard_file
 
 '''
  按照原始数据集划分
 '''
 
-def to_libsvm_encode(datapath):
+def external_shuffle(in_file, out_file, memory_limit, seed, block_lines=100000):
+    '''
+     外排序式的打乱: 先把每一行随机分散到若干临时桶文件, 再逐个桶读入内存打乱后顺序拼接,
+     桶的数量由memory_limit(字节)决定, 保证任意时刻只有一个桶在内存中; 固定seed时结果可复现,
+     返回行数与正样本数
+    '''
+    # 一行读入内存后约占其字节数的2倍
+    bucket_nums = max(1, int(np.ceil(os.path.getsize(in_file) * 2 / memory_limit)))
+    # 所有桶文件同时打开, 留出一部分文件描述符给输入输出文件和其他模块
+    max_open_files = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if max_open_files != resource.RLIM_INFINITY and bucket_nums > max_open_files - 64:
+        raise ValueError('external shuffle of {} needs {} buckets but only {} files can be open, '
+                         'raise memory_limit or ulimit -n'.format(in_file, bucket_nums, max_open_files))
+    random_state = np.random.RandomState(seed)
+
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(out_file)))
+    bucket_paths = [os.path.join(tmp_dir, 'bucket_' + str(i)) for i in range(bucket_nums)]
+    print('###### external shuffle with {} buckets ######\n'.format(bucket_nums))
+
+    rows, positives = 0, 0
+    try:
+        # 出错时ExitStack关闭已经打开的桶文件, finally再删除临时目录
+        with ExitStack() as stack:
+            bucket_files = [stack.enter_context(open(bucket_path, 'wb')) for bucket_path in bucket_paths]
+            f = stack.enter_context(open(in_file, 'rb'))
+            while True:
+                lines = list(islice(f, block_lines))
+                if not lines:
+                    break
+                bucket_idxs = random_state.randint(0, bucket_nums, size=len(lines))
+                for line, bucket_idx in zip(lines, bucket_idxs):
+                    bucket_files[bucket_idx].write(line if line.endswith(b'\n') else line + b'\n')
+                rows += len(lines)
+                positives += sum(line.startswith(b'1') for line in lines)
+
+        with open(out_file, 'wb') as outfile:
+            for i, bucket_path in enumerate(bucket_paths):
+                with open(bucket_path, 'rb') as bucket_f:
+                    lines = bucket_f.readlines()
+                for idx in random_state.permutation(len(lines)):
+                    outfile.write(lines[idx])
+                del lines
+                os.remove(bucket_path)
+                print(datetime.now(), 'shuffled bucket', i + 1, '/', bucket_nums)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return rows, positives
+
+def split_test_days(datapath, test_days):
+    '''
+     按day_index.csv把train.txt中test_days这几天的行按原顺序写到test_.txt, 其余的行写到train_1.txt,
+     之后只打乱train_1.txt, 测试集不会混进训练集
+    '''
+    day_indexs = np.loadtxt(datapath + 'day_index.csv', delimiter=',', dtype=np.int64, ndmin=2)
+    is_test = np.zeros(int(day_indexs[:, 2].max()) + 1, dtype=bool)
+    for day in test_days:
+        if day not in day_indexs[:, 0]:
+            raise ValueError('day {} is not in {}day_index.csv'.format(day, datapath))
+        for _, start, end in day_indexs[day_indexs[:, 0] == day]:
+            is_test[start: end + 1] = True
+
+    print('###### split test days {} ######\n'.format(test_days))
+    rows, positives = 0, 0
+    with open(datapath + 'train.txt', 'rb') as f, open(datapath + 'train_1.txt', 'wb') as train_f, \
+            open(datapath + 'test_.txt', 'wb') as test_f:
+        for e, line in enumerate(f):
+            if e < len(is_test) and is_test[e]:
+                test_f.write(line)
+                rows += 1
+                positives += line.startswith(b'1')
+            else:
+                train_f.write(line)
+    update_meta(datapath, {'files': {'test_.txt': file_stats(rows, positives)}})
+
+def to_libsvm_encode(datapath, memory_limit, seed, shard_nums=0, test_days=None):
     print('###### to libsvm encode ######\n')
+    # 给定test_days时先从train.txt划分出train_1.txt与test_.txt, 否则沿用已有的train_1.txt与test_.txt
+    if test_days:
+        split_test_days(datapath, test_days)
+
     train_encode = datapath + 'train.txt'
     new_train_file = datapath + 'train_1.txt'
 
@@ -36,14 +121,17 @@ def to_libsvm_encode(datapath):
     #         new_test_f_out.write(line.strip().replace(':1', '').replace('\t', ',') + '\n')
     #         # test_list.append(line.strip().replace(':1', '').split(' '))
 
-    train_data = pd.read_csv(new_train_file, header=None).astype(int)
-    idx = np.random.permutation(len(train_data))
-    shuffle_train_data = train_data.iloc[idx, :]
-
-    shuffle_train_data.to_csv(data_path + 'train_.txt', header=None, index=None)
+    rows, positives = external_shuffle(new_train_file, datapath + 'train_.txt', memory_limit, seed)
+    update_meta(datapath, {'files': {'train_.txt': file_stats(rows, positives)}})
 
     os.remove(new_train_file)
 
+    # 可选地把打乱后的训练集与测试集切成分片, 供多个进程各自读取
+    if shard_nums > 0:
+        for file_name in ['train_.txt', 'test_.txt']:
+            if os.path.exists(datapath + file_name):
+                shard_file(datapath, file_name, shard_nums)
+
     # new_test_encode = pd.
             # (new_test_file, header=None, index=None)
 
@@ -54,10 +142,15 @@ if __name__ == '__main__':
     parser.add_argument('--campaign_id', default='avazu/', help='1458, 3386, 3358, 3427, 3476, avazu')
     parser.add_argument('--is_to_csv', default=False)
     parser.add_argument('--is_separate_data', default=True)
+    parser.add_argument('--memory_limit', type=int, default=4096, help='打乱时的内存上限(MB)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--shard_nums', type=int, default=0, help='大于0时把train_.txt与test_.txt切成这么多个分片')
+    parser.add_argument('--test_days', default='', help='逗号分隔, 例如12, 不为空时先从train.txt中划分出这几天作为test_.txt')
 
     args = parser.parse_args()
 
     data_path = args.data_path + args.dataset_name + args.campaign_id
 
-    to_libsvm_encode(data_path)
+    test_days = [int(day) for day in args.test_days.split(',')] if args.test_days else None
+    to_libsvm_encode(data_path, args.memory_limit * 1024 * 1024, args.seed, args.shard_nums, test_days)
 
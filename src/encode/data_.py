@@ -4,12 +4,23 @@ import operator
 from csv import DictReader
 from datetime import datetime
 import argparse
+import os
+import re
+import shutil
+import zlib
+from multiprocessing import Pool
 import pandas as pd
+from meta_data import update_meta, read_meta, file_stats, count_file_stats, table_field_ranges
 
 '''
  只取训练集做测试
 '''
 
+FIELDS = ['hour', 'useragent', 'IP', 'region', 'city', 'adexchange', 'domain', 'slotid', 'slotwidth',
+          'slotheight', 'slotvisibility', 'slotformat', 'creative', 'keypage', 'usertag']
+
+DAY_TO_WEEKDAY = {4: '6', 5: '7', 6: '8', 0: '9', 1: '10', 2: '11', 3: '12'}
+
 def data_to_csv(datapath, is_to_csv):
     file_name = 'train.log.txt'
     data_path = datapath
@@ -28,7 +39,7 @@ def separate_day_data(datapath, is_separate_data):
     file_name = 'train.csv'
     data_path = datapath + file_name
     if is_separate_data:
-        day_to_weekday = {4: '6', 5: '7', 6: '8', 0: '9', 1: '10', 2: '11', 3: '12'}
+        day_to_weekday = DAY_TO_WEEKDAY
         train_data = pd.read_csv(data_path, header=None).drop([0])
         train_data.iloc[:, 1] = train_data.iloc[:, 1].astype(int)
         print('###### separate datas from day ######\n')
@@ -47,16 +58,10 @@ def to_libsvm_encode(datapath):
     train_encode = datapath+ 'train.txt'
     feature_index = datapath+ 'featindex.txt'
 
-    field = ['hour', 'useragent', 'IP', 'region', 'city', 'adexchange', 'domain', 'slotid', 'slotwidth',
-             'slotheight', 'slotvisibility', 'slotformat', 'creative', 'keypage', 'usertag']
+    field = FIELDS
 
     table = collections.defaultdict(lambda: 0)
 
-    # 为特征名建立编号, filed
-    def field_index(x):
-        index = field.index(x)
-        return index
-
     def getIndices(key):
         indices = table.get(key)
         if indices is None:
@@ -65,8 +70,11 @@ def to_libsvm_encode(datapath):
         return indices
 
     feature_indices = set()
+    day_spans = {}
+    rows, positives = 0, 0
     with open(train_encode, 'w') as outfile:
-        for e, row in enumerate(DictReader(open(train_path)), start=1):
+        reader = DictReader(open(train_path))
+        for e, row in enumerate(reader, start=1):
             features = []
             for k, v in row.items():
                 if k in field:
@@ -84,10 +92,25 @@ def to_libsvm_encode(datapath):
 
             outfile.write('{0},{1}\n'.format(row['click'], ','.join('{0}'.format(val) for val in features)))
 
+            update_day_spans(day_spans, int(row['weekday']), e - 1)
+            rows += 1
+            positives += row['click'] == '1'
+
+    write_featindex(table, feature_index)
+    columns = {'fields': [(i, k) for i, k in enumerate(reader.fieldnames) if k in field]}
+    write_encode_meta(datapath, columns, table_field_ranges(table, columns), len(table), day_spans, rows, positives,
+                      False, {'encode_mode': 'csv', 'min_count': 1})
+
+# 为特征名建立编号, filed
+def field_index(x):
+    index = FIELDS.index(x)
+    return index
+
+def write_featindex(table, feature_index):
     featvalue = sorted(table.items(), key=operator.itemgetter(1))
     fo = open(feature_index, 'w')
     for t, fv in enumerate(featvalue, start=1):
-        if t > len(field):
+        if t > len(FIELDS):
             k = fv[0].split('_')[0]
             idx = field_index(k)
             fo.write(str(idx) + ':' + fv[0] + '\t' + str(fv[1]) + '\n')
@@ -95,6 +118,441 @@ def to_libsvm_encode(datapath):
             fo.write(fv[0] + '\t' + str(fv[1]) + '\n')
     fo.close()
 
+def day_index_rows(day_spans):
+    # day_spans: weekday -> [首行下标, 末行下标], 按DAY_TO_WEEKDAY的顺序输出
+    day_data_indexs = []
+    for key in DAY_TO_WEEKDAY.keys():
+        if key in day_spans:
+            day_data_indexs.append([int(DAY_TO_WEEKDAY[key]), day_spans[key][0], day_spans[key][1]])
+
+    return day_data_indexs
+
+def write_day_index(day_spans, datapath):
+    day_data_indexs = day_index_rows(day_spans)
+
+    day_data_indexs_df = pd.DataFrame(data=day_data_indexs)
+    day_data_indexs_df.to_csv(datapath + 'day_index.csv', index=None, header=None)
+
+def update_day_spans(day_spans, weekday, e):
+    if weekday in day_spans:
+        day_spans[weekday][1] = e
+    else:
+        day_spans[weekday] = [e, e]
+
+def feature_keys(line_list, columns):
+    keys = []
+    for i, k in columns['fields']:
+        v = line_list[i]
+        keys.append(k + '_' + v if len(v) > 0 else k + '_' + 'other')
+
+    return keys
+
+def encode_line(line, columns, table, remap=None):
+    '''
+     将train.log.txt的一行编码为 click,feat_1,...,feat_n, 未出现过的特征在table末尾分配新编号,
+     remap中的低频特征先替换为对应特征域的field_other
+    '''
+    line_list = line.strip('\n').split('\t')
+    keys = feature_keys(line_list, columns)
+    if remap:
+        keys = [remap.get(kv, kv) for kv in keys]
+    features = [str(table.setdefault(kv, len(table))) for kv in keys]
+
+    return line_list[columns['click']] + ',' + ','.join(features) + '\n', int(line_list[columns['weekday']])
+
+def read_columns(header):
+    names = header.strip('\n').split('\t')
+    return {
+        'click': names.index('click'),
+        'weekday': names.index('weekday'),
+        'fields': [(i, k) for i, k in enumerate(names) if k in FIELDS]
+    }
+
+def prune_features(counts, min_count, field_order=None):
+    '''
+     按首次出现顺序为特征编号, 出现次数少于min_count的取值映射到该特征域的field_other,
+     field_order(特征域 -> 列序号)不为空时按特征域分配连续的编号区间, 域内仍保持首次出现顺序;
+     返回特征表, 低频特征的映射, 以及每个特征域的统计[取值数, 保留数, 剪枝取值数, 剪枝出现次数]
+    '''
+    keys = []
+    remap = {}
+    stats = {}
+    for kv, count in counts.items():
+        k = kv.split('_')[0]
+        field_stats = stats.setdefault(k, [0, 0, 0, 0])
+        field_stats[0] += 1
+        if count < min_count and kv != k + '_other':
+            remap[kv] = k + '_other'
+            field_stats[2] += 1
+            field_stats[3] += count
+            kv = k + '_other'
+        else:
+            field_stats[1] += 1
+        keys.append(kv)
+
+    if field_order is not None:
+        keys.sort(key=lambda kv: field_order[kv.split('_')[0]])
+
+    table = {}
+    for kv in keys:
+        table.setdefault(kv, len(table))
+
+    return table, remap, stats
+
+def field_order_of(columns):
+    return {k: j for j, (_, k) in enumerate(columns['fields'])}
+
+def write_prune_stats(stats, datapath):
+    stats_df = pd.DataFrame(data=[[k] + v for k, v in stats.items()],
+                            columns=['field', 'values', 'kept_values', 'pruned_values', 'pruned_rows'])
+    print(stats_df.to_string(index=False))
+    stats_df.to_csv(datapath + 'prune_stats.csv', index=None)
+
+def stream_encode(datapath, min_count=1, field_contiguous=False):
+    '''
+     单遍流式编码: 直接读取train.log.txt, 同时生成train.txt, day_index.csv与featindex.txt,
+     不再生成train.csv, 内存只与特征表的大小有关, 与文件大小无关;
+     min_count > 1或field_contiguous时先多读一遍统计频次, 低频特征归入field_other
+    '''
+    print('###### stream encode ######\n')
+    file_name = 'train.log.txt'
+    train_encode = datapath + 'train.txt'
+    feature_index = datapath + 'featindex.txt'
+
+    table = {}
+    remap = None
+    if min_count > 1 or field_contiguous:
+        with open(datapath + file_name, 'r') as filein:
+            columns = read_columns(filein.readline())
+        start, end = split_chunks(datapath + file_name, 1)[0]
+        counts, _, _, _ = scan_chunk((datapath + file_name, start, end, columns))
+        table, remap, stats = prune_features(counts, min_count, field_order_of(columns) if field_contiguous else None)
+        if min_count > 1:
+            write_prune_stats(stats, datapath)
+
+    day_spans = {}
+    rows, positives = 0, 0
+    with open(datapath + file_name, 'r') as filein, open(train_encode, 'w') as outfile:
+        columns = read_columns(filein.readline())
+        for e, line in enumerate(filein):
+            encoded_line, weekday = encode_line(line, columns, table, remap)
+            outfile.write(encoded_line)
+
+            update_day_spans(day_spans, weekday, e)
+            rows += 1
+            positives += encoded_line.startswith('1')
+
+            if (e + 1) % 100000 == 0:
+                print(datetime.now(), 'creating train.txt...', e + 1)
+
+    write_day_index(day_spans, datapath)
+    write_featindex(table, feature_index)
+    write_encode_meta(datapath, columns, table_field_ranges(table, columns), len(table), day_spans, rows, positives,
+                      field_contiguous, {'encode_mode': 'stream', 'min_count': min_count})
+
+def split_chunks(file_path, chunk_nums):
+    '''
+     按字节把文件(除表头)切分为chunk_nums块, 每块的起止位置都对齐到行首
+    '''
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        f.readline()
+        header_end = f.tell()
+        bounds = [header_end]
+        for i in range(1, chunk_nums):
+            pos = header_end + (file_size - header_end) * i // chunk_nums
+            f.seek(max(pos - 1, header_end))
+            f.readline()
+            if bounds[-1] < f.tell() < file_size:
+                bounds.append(f.tell())
+    bounds.append(file_size)
+
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+def read_chunk(file_path, start, end):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            pos += len(line)
+            yield line.decode()
+
+def scan_chunk(args):
+    # 第一遍: 按首次出现顺序统计块内特征的频次, 以及块内各天的起止行
+    file_path, start, end, columns = args
+    counts = collections.Counter()
+    day_spans = {}
+    rows, positives = 0, 0
+    for e, line in enumerate(read_chunk(file_path, start, end)):
+        line_list = line.strip('\n').split('\t')
+        for kv in feature_keys(line_list, columns):
+            counts[kv] += 1
+
+        update_day_spans(day_spans, int(line_list[columns['weekday']]), e)
+        rows += 1
+        positives += line_list[columns['click']] == '1'
+
+    return counts, day_spans, rows, positives
+
+def merge_day_spans(chunk_results):
+    # chunk_results: 按块顺序排列的(块内day_spans, 块内行数, 块内正样本数), 加上前面各块的行数偏移后合并
+    day_spans = {}
+    offset, positives = 0, 0
+    for chunk_day_spans, rows, chunk_positives in chunk_results:
+        for weekday, (first, last) in chunk_day_spans.items():
+            if weekday in day_spans:
+                day_spans[weekday][1] = last + offset
+            else:
+                day_spans[weekday] = [first + offset, last + offset]
+        offset += rows
+        positives += chunk_positives
+
+    return day_spans, offset, positives
+
+def write_encode_meta(datapath, columns, field_ranges, feature_nums, day_spans, rows, positives, field_contiguous,
+                      encode_params):
+    '''
+     field_contiguous为True时每个特征域的编号为连续区间[field_ranges[k][0], field_ranges[k][1]];
+     encode_params记录编码方式encode_mode及其参数(min_count, bucket_nums), 增量编码时按同样的方式编码新数据
+    '''
+    update_meta(datapath, dict(encode_params, **{
+        'field_nums': len(columns['fields']),
+        'feature_nums': feature_nums,
+        'field_ranges': field_ranges,
+        'field_contiguous': field_contiguous,
+        'day_index': day_index_rows(day_spans),
+        'files': {'train.txt': file_stats(rows, positives)}
+    }))
+
+def concat_parts(part_paths, train_encode):
+    with open(train_encode, 'wb') as outfile:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part_f:
+                shutil.copyfileobj(part_f, outfile)
+            os.remove(part_path)
+
+worker_table = None
+worker_remap = None
+
+def init_worker_table(table, remap):
+    global worker_table, worker_remap
+    worker_table = table
+    worker_remap = remap
+
+def encode_chunk(args):
+    # 第二遍: 用合并后的全局特征表编码块, 写入单独的分块文件
+    file_path, start, end, columns, part_path = args
+    with open(part_path, 'w') as outfile:
+        for line in read_chunk(file_path, start, end):
+            outfile.write(encode_line(line, columns, worker_table, worker_remap)[0])
+
+    return part_path
+
+def parallel_encode(datapath, worker_nums, min_count=1, field_contiguous=False):
+    '''
+     多进程编码: 先按字节切块并行统计各块的特征, 再按块顺序合并为全局特征表,
+     编号与串行的首次出现顺序一致, 与进程数和切块方式无关; 最后并行重写各块并拼接为train.txt
+    '''
+    print('###### parallel encode ######\n')
+    file_path = datapath + 'train.log.txt'
+    train_encode = datapath + 'train.txt'
+    feature_index = datapath + 'featindex.txt'
+
+    with open(file_path, 'r') as filein:
+        columns = read_columns(filein.readline())
+
+    chunks = split_chunks(file_path, worker_nums * 4)
+
+    with Pool(processes=worker_nums) as pool:
+        scan_results = pool.map(scan_chunk, [(file_path, start, end, columns) for start, end in chunks])
+
+    # Counter.update会保留各块的首次出现顺序
+    counts = collections.Counter()
+    for chunk_counts, _, _, _ in scan_results:
+        counts.update(chunk_counts)
+    table, remap, stats = prune_features(counts, min_count, field_order_of(columns) if field_contiguous else None)
+    if min_count > 1:
+        write_prune_stats(stats, datapath)
+    day_spans, rows, positives = merge_day_spans([scan_result[1:] for scan_result in scan_results])
+    print(datetime.now(), 'merged feature table', len(table), 'rows', rows)
+
+    part_paths = [train_encode + '.part' + str(i) for i in range(len(chunks))]
+    with Pool(processes=worker_nums, initializer=init_worker_table, initargs=(table, remap)) as pool:
+        pool.map(encode_chunk, [(file_path, start, end, columns, part_path)
+                                for (start, end), part_path in zip(chunks, part_paths)])
+
+    concat_parts(part_paths, train_encode)
+
+    write_day_index(day_spans, datapath)
+    write_featindex(table, feature_index)
+    write_encode_meta(datapath, columns, table_field_ranges(table, columns), len(table), day_spans, rows, positives,
+                      field_contiguous, {'encode_mode': 'parallel', 'min_count': min_count})
+
+def hash_index(kv, field_idx, bucket_nums):
+    # crc32在不同进程与不同运行之间稳定, 不受PYTHONHASHSEED影响
+    return field_idx * bucket_nums + zlib.crc32(kv.encode()) % bucket_nums
+
+def hash_encode_line(line, columns, bucket_nums):
+    '''
+     哈希编码: 第j个特征域的取值映射到[j * bucket_nums, (j + 1) * bucket_nums)内, 不需要全局特征表
+    '''
+    line_list = line.strip('\n').split('\t')
+    features = [str(hash_index(kv, j, bucket_nums)) for j, kv in enumerate(feature_keys(line_list, columns))]
+
+    return line_list[columns['click']] + ',' + ','.join(features) + '\n', int(line_list[columns['weekday']])
+
+def hash_encode_chunk(args):
+    file_path, start, end, columns, bucket_nums, part_path = args
+    day_spans = {}
+    rows, positives = 0, 0
+    with open(part_path, 'w') as outfile:
+        for e, line in enumerate(read_chunk(file_path, start, end)):
+            encoded_line, weekday = hash_encode_line(line, columns, bucket_nums)
+            outfile.write(encoded_line)
+            update_day_spans(day_spans, weekday, e)
+            rows += 1
+            positives += encoded_line.startswith('1')
+
+    return day_spans, rows, positives
+
+def write_hash_featindex(columns, bucket_nums, feature_index):
+    # 每个特征域写一行, 记录该域哈希区间的最后一个编号, 读取最后一行即可得到feature_nums = field_nums * bucket_nums
+    fo = open(feature_index, 'w')
+    for j, (_, k) in enumerate(columns['fields']):
+        fo.write(str(field_index(k)) + ':' + k + '_hash' + '\t' + str((j + 1) * bucket_nums - 1) + '\n')
+    fo.close()
+
+def hash_encode(datapath, bucket_nums, worker_nums):
+    '''
+     哈希技巧编码: 特征空间大小固定为field_nums * bucket_nums, 各块可以独立编码, 无需合并特征表
+    '''
+    print('###### hash encode ######\n')
+    file_path = datapath + 'train.log.txt'
+    train_encode = datapath + 'train.txt'
+    feature_index = datapath + 'featindex.txt'
+
+    with open(file_path, 'r') as filein:
+        columns = read_columns(filein.readline())
+
+    chunks = split_chunks(file_path, worker_nums * 4)
+    part_paths = [train_encode + '.part' + str(i) for i in range(len(chunks))]
+
+    with Pool(processes=worker_nums) as pool:
+        results = pool.map(hash_encode_chunk, [(file_path, start, end, columns, bucket_nums, part_path)
+                                               for (start, end), part_path in zip(chunks, part_paths)])
+
+    day_spans, rows, positives = merge_day_spans(results)
+    print(datetime.now(), 'hash encoded rows', rows, 'feature_nums', len(columns['fields']) * bucket_nums)
+
+    concat_parts(part_paths, train_encode)
+
+    write_day_index(day_spans, datapath)
+    write_hash_featindex(columns, bucket_nums, feature_index)
+    field_ranges = {k: [j * bucket_nums, (j + 1) * bucket_nums - 1, bucket_nums]
+                    for j, (_, k) in enumerate(columns['fields'])}
+    write_encode_meta(datapath, columns, field_ranges, len(columns['fields']) * bucket_nums, day_spans, rows, positives,
+                      True, {'encode_mode': 'hash', 'bucket_nums': bucket_nums})
+
+def read_featindex(feature_index):
+    # featindex.txt每行为[field_idx:]field_value\tid, 还原为field_value -> id的特征表
+    table = {}
+    with open(feature_index) as f:
+        for line in f:
+            kv, idx = line.rstrip('\n').split('\t')
+            table[re.sub(r'^\d+:', '', kv)] = int(idx)
+
+    return table
+
+def append_table(datapath, append_file, columns, meta):
+    '''
+     按原编码的方式准备新数据的特征表: 已有取值的编号不变, 新取值在新数据中出现次数少于min_count时
+     与原编码一样归入field_other, 其余在末尾分配新编号; 原编码按特征域连续编号时, 出现新编号会破坏连续性, 直接报错
+    '''
+    table = read_featindex(datapath + 'featindex.txt')
+    min_count = meta.get('min_count', 1)
+
+    start, end = split_chunks(datapath + append_file, 1)[0]
+    counts, _, _, _ = scan_chunk((datapath + append_file, start, end, columns))
+    remap = {kv: kv.split('_')[0] + '_other' for kv, count in counts.items() if kv not in table and count < min_count}
+    new_keys = {remap.get(kv, kv) for kv in counts} - set(table)
+    if new_keys and meta.get('field_contiguous'):
+        raise ValueError('{} new feature values would break the field_contiguous layout, '
+                         're-encode the whole dataset instead'.format(len(new_keys)))
+
+    return table, remap
+
+def append_encode(datapath, append_file, day_label=None):
+    '''
+     增量编码新的一天: 按meta.json中记录的编码方式编码新数据, 追加到train.txt并扩展day_index.csv,
+     已有特征的编号保持不变; hash编码的数据直接哈希, 特征空间不变, 其它方式沿用featindex.txt并在末尾分配新编号;
+     day_label不为空时append_file中的所有行都记为这一天
+    '''
+    print('###### append encode ######\n')
+    train_encode = datapath + 'train.txt'
+    feature_index = datapath + 'featindex.txt'
+
+    meta = read_meta(datapath)
+    encode_mode = meta.get('encode_mode')
+    if encode_mode not in ['csv', 'stream', 'parallel', 'hash']:
+        raise ValueError('meta.json does not record how {} was encoded, re-encode it before appending'.format(datapath))
+
+    with open(datapath + append_file, 'r') as filein:
+        columns = read_columns(filein.readline())
+    if len(columns['fields']) != meta['field_nums']:
+        raise ValueError('{} has {} fields, the encoded data has {}'.format(append_file, len(columns['fields']),
+                                                                          meta['field_nums']))
+
+    if encode_mode == 'hash':
+        old_feature_nums = meta['feature_nums']
+        encode = lambda line: hash_encode_line(line, columns, meta['bucket_nums'])
+    else:
+        table, remap = append_table(datapath, append_file, columns, meta)
+        old_feature_nums = len(table)
+        encode = lambda line: encode_line(line, columns, table, remap)
+
+    day_indexs = pd.read_csv(datapath + 'day_index.csv', header=None).values
+    offset = int(day_indexs[:, 2].max()) + 1
+
+    old_stats = meta.get('files', {}).get('train.txt')
+    if old_stats is None:
+        old_stats = count_file_stats(train_encode)
+
+    day_spans = {}
+    rows, positives = 0, 0
+    with open(datapath + append_file, 'r') as filein, open(train_encode, 'a') as outfile:
+        filein.readline()
+        for e, line in enumerate(filein):
+            encoded_line, weekday = encode(line)
+            outfile.write(encoded_line)
+
+            update_day_spans(day_spans, weekday, e + offset)
+            rows += 1
+            positives += encoded_line.startswith('1')
+
+    if day_label is not None:
+        new_day_indexs = [[int(day_label), offset, offset + rows - 1]]
+    else:
+        new_day_indexs = day_index_rows(day_spans)
+    for day_index in new_day_indexs:
+        if day_index[0] in day_indexs[:, 0]:
+            print('warning: day', day_index[0], 'already in day_index.csv')
+
+    day_data_indexs_df = pd.DataFrame(data=day_indexs.tolist() + new_day_indexs)
+    day_data_indexs_df.to_csv(datapath + 'day_index.csv', index=None, header=None)
+
+    new_meta = {
+        'day_index': day_data_indexs_df.values.tolist(),
+        'files': {'train.txt': file_stats(old_stats['rows'] + rows, old_stats['positives'] + positives)}
+    }
+    if encode_mode != 'hash':
+        write_featindex(table, feature_index)
+        new_meta['feature_nums'] = len(table)
+        new_meta['field_ranges'] = table_field_ranges(table, columns)
+    update_meta(datapath, new_meta)
+    print(datetime.now(), 'appended rows', rows, 'feature_nums', old_feature_nums, '->',
+          new_meta.get('feature_nums', old_feature_nums))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--data_path', default='../../data/')
@@ -102,13 +560,29 @@ if __name__ == '__main__':
     parser.add_argument('--campaign_id', default='3386/', help='1458, 3386')
     parser.add_argument('--is_to_csv', default=True)
     parser.add_argument('--is_separate_data', default=True)
+    parser.add_argument('--encode_mode', default='stream', help='csv, stream, parallel, hash, append')
+    parser.add_argument('--append_file', default='train.log.txt', help='append模式下新一天的原始日志')
+    parser.add_argument('--append_day', default=None, help='append模式下新数据的日期, 为空时按weekday推断')
+    parser.add_argument('--min_count', type=int, default=1, help='出现次数少于min_count的特征归入field_other')
+    parser.add_argument('--field_contiguous', action='store_true', help='每个特征域分配连续的编号区间')
+    parser.add_argument('--bucket_nums', type=int, default=100000, help='hash模式下每个特征域的桶数')
+    parser.add_argument('--worker_nums', type=int, default=os.cpu_count())
 
     args = parser.parse_args()
 
     data_path = args.data_path + args.dataset_name + args.campaign_id
-    data_to_csv(data_path, args.is_to_csv)
+    if args.encode_mode == 'stream':
+        stream_encode(data_path, args.min_count, args.field_contiguous)
+    elif args.encode_mode == 'parallel':
+        parallel_encode(data_path, args.worker_nums, args.min_count, args.field_contiguous)
+    elif args.encode_mode == 'append':
+        append_encode(data_path, args.append_file, args.append_day)
+    elif args.encode_mode == 'hash':
+        hash_encode(data_path, args.bucket_nums, args.worker_nums)
+    else:
+        data_to_csv(data_path, args.is_to_csv)
 
-    separate_day_data(data_path, args.is_separate_data)
+        separate_day_data(data_path, args.is_separate_data)
 
-    to_libsvm_encode(data_path)
+        to_libsvm_encode(data_path)
 
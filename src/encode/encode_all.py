@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+from multiprocessing import Pool
+import pandas as pd
+from data_ import stream_encode
+from all_data_ import to_libsvm_encode
+from to_binary import to_binary
+from to_shards import shard_file
+
+'''
+ 多个campaign的并行预处理: 每个campaign在进程池中依次执行编码(含按天划分), 打乱, 转二进制, 分片四个阶段,
+ 打乱阶段与all_data_.to_libsvm_encode相同: 先把test_days这几天划分为test_.txt, 只打乱其余的训练行,
+ 输入文件的mtime与哈希值没有变化且输出都存在的阶段会被跳过, 最后输出每个阶段的耗时
+'''
+
+STAMP_FILE_NAME = 'encode_stamp.json'
+
+STAGES = {
+    # 阶段名: (输入文件, 输出文件, 影响输出的参数)
+    'encode': (['train.log.txt'], ['train.txt', 'day_index.csv', 'featindex.txt'], ['min_count', 'field_contiguous']),
+    'shuffle': (['train.txt', 'day_index.csv'], ['train_.txt', 'test_.txt'], ['memory_limit', 'seed', 'test_days']),
+    'binary': (['train.txt', 'train_.txt', 'test_.txt'], ['train.npy', 'train_.npy', 'test_.npy'], []),
+    'shard': (['train_.txt', 'test_.txt'], ['train_.shards.json', 'test_.shards.json'], ['shard_nums']),
+}
+
+def stage_files(datapath, stage):
+    # binary和shard阶段只处理已经存在的文件
+    input_files, output_files, _ = STAGES[stage]
+    if stage in ('binary', 'shard'):
+        pairs = [(i, o) for i, o in zip(input_files, output_files) if os.path.exists(datapath + i)]
+        return [i for i, _ in pairs], [o for _, o in pairs]
+
+    return input_files, output_files
+
+def file_hash(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+def read_stamps(datapath):
+    stamp_file = datapath + STAMP_FILE_NAME
+    if not os.path.exists(stamp_file):
+        return {}
+
+    with open(stamp_file) as f:
+        return json.load(f)
+
+def write_stamps(datapath, stamps):
+    with open(datapath + STAMP_FILE_NAME, 'w') as f:
+        json.dump(stamps, f, indent=1)
+
+def input_stamps(datapath, stage, old_stamp):
+    '''
+     记录每个输入文件的mtime, 大小和md5; mtime与大小都没变时沿用旧的md5, 避免重复读取大文件
+    '''
+    stamps = {}
+    for file_name in stage_files(datapath, stage)[0]:
+        stat = os.stat(datapath + file_name)
+        old_file_stamp = old_stamp.get(file_name, {})
+        if old_file_stamp.get('mtime') == stat.st_mtime and old_file_stamp.get('size') == stat.st_size:
+            md5 = old_file_stamp['md5']
+        else:
+            md5 = file_hash(datapath + file_name)
+        stamps[file_name] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'md5': md5}
+
+    return stamps
+
+def is_current(datapath, stage, new_stamp, old_stamp):
+    # 只比较md5与参数, 文件被touch过但内容未变时同样视为最新
+    input_files, output_files = stage_files(datapath, stage)
+    if not all(os.path.exists(datapath + file_name) for file_name in output_files):
+        return False
+    if old_stamp.get('params') != new_stamp['params']:
+        return False
+
+    return all(old_stamp.get(file_name, {}).get('md5') == new_stamp[file_name]['md5'] for file_name in input_files)
+
+def run_stage(datapath, stage, params):
+    if stage == 'encode':
+        stream_encode(datapath, params['min_count'], params['field_contiguous'])
+    elif stage == 'shuffle':
+        to_libsvm_encode(datapath, params['memory_limit'], params['seed'], test_days=params['test_days'])
+    elif stage == 'binary':
+        for file_name in stage_files(datapath, stage)[0]:
+            to_binary(datapath, file_name)
+    elif stage == 'shard':
+        for file_name in stage_files(datapath, stage)[0]:
+            shard_file(datapath, file_name, params['shard_nums'])
+
+def process_campaign(args):
+    '''
+     每个阶段开始与结束时立即输出进度; 某个阶段出错时记录为failed并跳过该campaign之后的阶段,
+     不影响其它campaign, 已完成阶段的记录照常保存
+    '''
+    datapath, campaign_id, stages, params = args
+    stamps = read_stamps(datapath)
+    reports = []
+    for k, stage in enumerate(stages, start=1):
+        start_time = time.time()
+        print(datetime.now(), 'campaign', campaign_id, 'stage [{}/{}]'.format(k, len(stages)), stage, 'started',
+              flush=True)
+        try:
+            old_stamp = stamps.get(stage, {})
+            new_stamp = input_stamps(datapath, stage, old_stamp)
+            new_stamp['params'] = {k: params[k] for k in STAGES[stage][2]}
+
+            if is_current(datapath, stage, new_stamp, old_stamp):
+                status = 'skipped'
+            else:
+                run_stage(datapath, stage, params)
+                status = 'done'
+        except Exception as e:
+            reports.append([campaign_id, stage, 'failed', '{:.2f}s'.format(time.time() - start_time)])
+            print(datetime.now(), 'campaign', campaign_id, 'stage [{}/{}]'.format(k, len(stages)), stage, 'failed:',
+                  repr(e), flush=True)
+            break
+
+        stamps[stage] = new_stamp
+        write_stamps(datapath, stamps)
+        reports.append([campaign_id, stage, status, '{:.2f}s'.format(time.time() - start_time)])
+        print(datetime.now(), 'campaign', campaign_id, 'stage [{}/{}]'.format(k, len(stages)), stage, status,
+              '[{}]'.format(reports[-1][3]), flush=True)
+
+    return reports
+
+def find_campaigns(dataset_path):
+    return sorted(campaign_id for campaign_id in os.listdir(dataset_path)
+                  if os.path.exists(os.path.join(dataset_path, campaign_id, 'train.log.txt')))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='../../data/')
+    parser.add_argument('--dataset_name', default='ipinyou/', help='ipinyou, cretio, yoyi')
+    parser.add_argument('--campaign_ids', default='', help='逗号分隔, 例如1458,3386, 为空时处理数据集目录下所有含train.log.txt的campaign')
+    parser.add_argument('--stages', default='encode,shuffle', help='encode, shuffle, binary, shard')
+    parser.add_argument('--min_count', type=int, default=1)
+    parser.add_argument('--field_contiguous', action='store_true')
+    parser.add_argument('--memory_limit', type=int, default=4096, help='打乱时每个进程的内存上限(MB)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--test_days', default='12', help='逗号分隔, 打乱阶段划分为test_.txt的日期')
+    parser.add_argument('--shard_nums', type=int, default=8, help='shard阶段的分片数')
+    parser.add_argument('--worker_nums', type=int, default=os.cpu_count())
+
+    args = parser.parse_args()
+
+    dataset_path = args.data_path + args.dataset_name
+    campaign_ids = args.campaign_ids.split(',') if args.campaign_ids else find_campaigns(dataset_path)
+    stages = args.stages.split(',')
+    if not campaign_ids:
+        sys.exit('no campaign with train.log.txt found in ' + dataset_path)
+    params = {
+        'min_count': args.min_count,
+        'field_contiguous': args.field_contiguous,
+        'memory_limit': args.memory_limit * 1024 * 1024,
+        'seed': args.seed,
+        'test_days': [int(day) for day in args.test_days.split(',')],
+        'shard_nums': args.shard_nums
+    }
+
+    start_time = time.time()
+    all_reports = []
+    with Pool(processes=min(args.worker_nums, len(campaign_ids))) as pool:
+        tasks = [(dataset_path + campaign_id + '/', campaign_id, stages, params) for campaign_id in campaign_ids]
+        for i, reports in enumerate(pool.imap_unordered(process_campaign, tasks), start=1):
+            print(datetime.now(), '[{}/{}]'.format(i, len(tasks)), 'campaign', reports[0][0], 'finished', flush=True)
+            all_reports.extend(reports)
+
+    report_df = pd.DataFrame(data=all_reports, columns=['campaign_id', 'stage', 'status', 'seconds'])
+    report_df['report'] = report_df['status'] + ' ' + report_df['seconds']
+    # 失败的campaign没有之后阶段的记录, 显示为NaN
+    print(report_df.pivot(index='campaign_id', columns='stage', values='report').reindex(columns=stages).to_string())
+    print('total [{}s]'.format(round(time.time() - start_time, 2)))
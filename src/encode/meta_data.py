@@ -0,0 +1,62 @@
+import json
+import os
+
+'''
+ 数据集的元数据文件meta.json, 由各编码脚本写出, 记录field_nums, feature_nums, 每个特征域的编号范围,
+ day_index以及各数据文件的行数和正样本率, 训练脚本读取它即可得到这些信息而不必扫描数据
+'''
+
+META_FILE_NAME = 'meta.json'
+
+def read_meta(datapath):
+    meta_file = datapath + META_FILE_NAME
+    if not os.path.exists(meta_file):
+        return {}
+
+    with open(meta_file) as f:
+        return json.load(f)
+
+def read_current_meta(datapath, file_name):
+    # 与creat_data.load_current_meta相同: meta.json比file_name旧时其中的信息已经过期, 返回空字典
+    meta_file, data_file = datapath + META_FILE_NAME, datapath + file_name
+    if os.path.exists(meta_file) and os.path.exists(data_file) and \
+            os.path.getmtime(meta_file) < os.path.getmtime(data_file):
+        print('warning: {} is older than {}, ignored'.format(meta_file, data_file))
+        return {}
+
+    return read_meta(datapath)
+
+def update_meta(datapath, meta):
+    # 与已有的meta.json合并, files按文件名逐个覆盖
+    old_meta = read_meta(datapath)
+    files = old_meta.get('files', {})
+    files.update(meta.pop('files', {}))
+    old_meta.update(meta)
+    old_meta['files'] = files
+
+    with open(datapath + META_FILE_NAME, 'w') as f:
+        json.dump(old_meta, f, indent=1)
+
+def file_stats(rows, positives):
+    return {'rows': int(rows), 'positives': int(positives), 'positive_rate': positives / rows if rows else 0.0}
+
+def count_file_stats(data_file):
+    # 编码后的文件每行以click开头
+    rows, positives = 0, 0
+    with open(data_file, 'rb') as f:
+        for line in f:
+            rows += 1
+            positives += line.startswith(b'1')
+
+    return file_stats(rows, positives)
+
+def table_field_ranges(table, columns):
+    # 每个特征域的[最小编号, 最大编号, 取值数]
+    ranges = {k: [None, None, 0] for _, k in columns['fields']}
+    for kv, idx in table.items():
+        field_range = ranges[kv.split('_')[0]]
+        field_range[0] = idx if field_range[0] is None else min(field_range[0], idx)
+        field_range[1] = idx if field_range[1] is None else max(field_range[1], idx)
+        field_range[2] += 1
+
+    return ranges
@@ -0,0 +1,143 @@
+import json
+import os
+import zlib
+import argparse
+from datetime import datetime
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from meta_data import read_current_meta, update_meta, file_stats
+
+'''
+ 将编码后的train.txt/train_.txt/test_.txt等逗号分隔文本一次性转换为int32的.npy矩阵,
+ 并写出记录field_nums, feature_nums与行数的头文件, 之后可直接用np.load(mmap_mode='r')内存映射读取;
+ --format blk时写出按block_rows行分块, 每块用zlib独立压缩的.blk文件, 块的偏移量记录在.blk.json中,
+ 可以随机读取任意行区间, 多个读取者也可以并行解压不同的块
+'''
+
+def count_lines(file_path):
+    lines = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            lines += block.count(b'\n')
+
+    return lines
+
+def to_binary(datapath, file_name, chunk_size=1000000):
+    data_file = datapath + file_name
+    stem = os.path.splitext(data_file)[0]
+
+    rows = count_lines(data_file)
+    if rows == 0:
+        raise ValueError('{} is empty, nothing to convert'.format(data_file))
+    with open(data_file, 'r') as f:
+        cols = len(f.readline().strip().split(','))
+
+    print('###### {} to binary, {} rows ######\n'.format(file_name, rows))
+    data_fm = np.lib.format.open_memmap(stem + '.npy', mode='w+', dtype=np.int32, shape=(rows, cols))
+
+    start = 0
+    max_feature = -1
+    positives = 0
+    for chunk in pd.read_csv(data_file, header=None, dtype=np.int32, chunksize=chunk_size):
+        values = chunk.values
+        data_fm[start: start + len(values)] = values
+        max_feature = max(max_feature, int(values[:, 1:].max()))
+        positives += int(values[:, 0].sum())
+        start += len(values)
+        print(datetime.now(), 'converting', file_name, start)
+    data_fm.flush()
+    del data_fm
+
+    # 以编码时写出的meta.json为准, 没有或已过期时用数据中出现的最大编号
+    header = {
+        'field_nums': cols - 1,
+        'feature_nums': read_current_meta(datapath, 'featindex.txt').get('feature_nums', max_feature + 1),
+        'rows': rows,
+        'dtype': 'int32'
+    }
+    with open(stem + '.json', 'w') as f:
+        json.dump(header, f)
+
+    update_meta(datapath, {
+        'field_nums': header['field_nums'],
+        'feature_nums': header['feature_nums'],
+        'files': {file_name: file_stats(rows, positives)}
+    })
+
+def compress_block(args):
+    values, level = args
+    return zlib.compress(np.ascontiguousarray(values, dtype=np.int32).tobytes(), level)
+
+def to_blocks(datapath, file_name, block_rows=65536, level=6, worker_nums=os.cpu_count()):
+    data_file = datapath + file_name
+    stem = os.path.splitext(data_file)[0]
+
+    # 空文件没有块, 也得不到列数, 在写.blk之前直接报错
+    if os.path.getsize(data_file) == 0:
+        raise ValueError('{} is empty, nothing to convert'.format(data_file))
+
+    print('###### {} to blocks, {} rows per block ######\n'.format(file_name, block_rows))
+    rows, cols, positives, max_feature = 0, None, 0, -1
+    offsets = [0]
+    with open(stem + '.blk', 'wb') as blk_f, Pool(processes=worker_nums) as pool:
+        chunks = (chunk.values for chunk in pd.read_csv(data_file, header=None, dtype=np.int32, chunksize=block_rows))
+
+        def block_args():
+            nonlocal rows, cols, positives, max_feature
+            for values in chunks:
+                rows += len(values)
+                cols = values.shape[1]
+                positives += int(values[:, 0].sum())
+                max_feature = max(max_feature, int(values[:, 1:].max()))
+                yield values, level
+
+        # imap保持块的顺序, 压缩在进程池中并行
+        for block in pool.imap(compress_block, block_args()):
+            blk_f.write(block)
+            offsets.append(offsets[-1] + len(block))
+            if len(offsets) % 100 == 0:
+                print(datetime.now(), 'compressing', file_name, rows)
+
+    header = {
+        'field_nums': cols - 1,
+        'feature_nums': read_current_meta(datapath, 'featindex.txt').get('feature_nums', max_feature + 1),
+        'rows': rows,
+        'cols': cols,
+        'dtype': 'int32',
+        'codec': 'zlib',
+        'block_rows': block_rows,
+        'offsets': offsets
+    }
+    with open(stem + '.blk.json', 'w') as f:
+        json.dump(header, f)
+
+    print(datetime.now(), file_name, 'compressed {} -> {} bytes'.format(os.path.getsize(data_file), offsets[-1]))
+
+    update_meta(datapath, {
+        'field_nums': header['field_nums'],
+        'feature_nums': header['feature_nums'],
+        'files': {file_name: file_stats(rows, positives)}
+    })
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='../../data/')
+    parser.add_argument('--dataset_name', default='ipinyou/', help='ipinyou, cretio, yoyi, avazu')
+    parser.add_argument('--campaign_id', default='1458/', help='1458, 3386, 3358, 3427, 3476, avazu')
+    parser.add_argument('--file_names', default='train.txt,train_.txt,test_.txt')
+    parser.add_argument('--format', default='npy', help='npy, blk')
+    parser.add_argument('--block_rows', type=int, default=65536, help='blk格式每个压缩块的行数')
+    parser.add_argument('--level', type=int, default=6, help='blk格式的zlib压缩等级')
+    parser.add_argument('--worker_nums', type=int, default=os.cpu_count())
+
+    args = parser.parse_args()
+
+    data_path = args.data_path + args.dataset_name + args.campaign_id
+    for file_name in args.file_names.split(','):
+        if not os.path.exists(data_path + file_name):
+            continue
+        if args.format == 'blk':
+            to_blocks(data_path, file_name, args.block_rows, args.level, args.worker_nums)
+        else:
+            to_binary(data_path, file_name)
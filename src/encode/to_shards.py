@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import argparse
+from datetime import datetime
+from meta_data import read_current_meta, count_file_stats
+
+'''
+ 将编码后的train_.txt/test_.txt等文件按行的先后切成shard_nums个连续的分片, 写到<stem>_shards/part-xxxxx.txt,
+ 并写出清单<stem>.shards.json, 记录源文件的mtime与大小, 每个分片的文件名, 起始行, 行数与正样本数;
+ 训练或预测时每个进程(worker)只读取属于自己的分片, 不再共用同一个文件
+'''
+
+def shard_dir_of(data_file):
+    return os.path.splitext(data_file)[0] + '_shards'
+
+def manifest_file_of(data_file):
+    return os.path.splitext(data_file)[0] + '.shards.json'
+
+def source_stats(datapath, file_name):
+    # 优先使用meta.json中记录的行数与正样本数, meta.json已过期时重新统计
+    file_meta = read_current_meta(datapath, file_name).get('files', {}).get(file_name)
+    if file_meta is not None:
+        return file_meta
+
+    return count_file_stats(datapath + file_name)
+
+def shard_file(datapath, file_name, shard_nums):
+    data_file = datapath + file_name
+    stats = source_stats(datapath, file_name)
+    rows = stats['rows']
+    shard_rows = [rows // shard_nums + (1 if i < rows % shard_nums else 0) for i in range(shard_nums)]
+    # 清单记录源文件的mtime与大小, 读取分片时据此判断源文件是否在切分之后被修改过
+    source_stat = os.stat(data_file)
+
+    # 先删掉旧清单, 中途出错时不会留下指向新旧混杂分片的清单
+    manifest_file = manifest_file_of(data_file)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+    shard_dir = shard_dir_of(data_file)
+    if os.path.exists(shard_dir):
+        shutil.rmtree(shard_dir)
+    os.mkdir(shard_dir)
+
+    print('###### {} to {} shards ######\n'.format(file_name, shard_nums))
+    shards = []
+    start_row = 0
+    with open(data_file, 'rb') as f:
+        for i, rows_i in enumerate(shard_rows):
+            part_name = 'part-{:05d}.txt'.format(i)
+            positives = 0
+            with open(os.path.join(shard_dir, part_name), 'wb') as part_f:
+                for _ in range(rows_i):
+                    line = f.readline()
+                    if not line:
+                        raise ValueError('{} has fewer rows than the {} in meta.json'.format(data_file, rows))
+                    positives += line.startswith(b'1')
+                    part_f.write(line)
+
+            shards.append({
+                'file': os.path.basename(shard_dir) + '/' + part_name,
+                'start_row': start_row,
+                'rows': rows_i,
+                'positives': positives
+            })
+            start_row += rows_i
+            print(datetime.now(), file_name, part_name, rows_i)
+
+        if f.readline():
+            raise ValueError('{} has more rows than the {} in meta.json'.format(data_file, rows))
+
+    positives = sum(shard['positives'] for shard in shards)
+    if positives != stats['positives']:
+        raise ValueError('{} has {} positives but meta.json records {}'.format(data_file, positives, stats['positives']))
+
+    manifest = {
+        'file_name': file_name,
+        'mtime': source_stat.st_mtime,
+        'size': source_stat.st_size,
+        'shard_nums': shard_nums,
+        'rows': rows,
+        'positives': positives,
+        'shards': shards
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return manifest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='../../data/')
+    parser.add_argument('--dataset_name', default='ipinyou/', help='ipinyou, cretio, yoyi, avazu')
+    parser.add_argument('--campaign_id', default='1458/', help='1458, 3386, 3358, 3427, 3476, avazu')
+    parser.add_argument('--file_names', default='train_.txt,test_.txt')
+    parser.add_argument('--shard_nums', type=int, default=8)
+
+    args = parser.parse_args()
+
+    data_path = args.data_path + args.dataset_name + args.campaign_id
+    for file_name in args.file_names.split(','):
+        if os.path.exists(data_path + file_name):
+            shard_file(data_path, file_name, args.shard_nums)
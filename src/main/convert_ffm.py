@@ -0,0 +1,27 @@
+import argparse
+import torch
+import src.models.p_model as Model
+import src.models.creat_data as Data
+
+# 把预训练的FFMbest.pth转换为CompactFFM的参数CompactFFMbest.pth
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='../../data/')
+    parser.add_argument('--dataset_name', default='ipinyou/', help='ipinyou, cretio, yoyi, avazu')
+    parser.add_argument('--campaign_id', default='1458/', help='1458, 3358, 3386, 3427, 3476, avazu')
+    parser.add_argument('--data_file_name', default='train.txt', help='编号不按field连续时, 从这个文件统计每个特征所属的field')
+    parser.add_argument('--save_param_dir', default='../models/model_params/')
+
+    args = parser.parse_args()
+
+    data_path = args.data_path + args.dataset_name + args.campaign_id
+    FFM_pretrain_params = torch.load(args.save_param_dir + args.campaign_id + 'FFMbest.pth', map_location='cpu')
+
+    feature_nums = FFM_pretrain_params['linear.weight'].shape[0]
+    feature_fields = Data.load_feature_fields(data_path, feature_nums, args.data_file_name)
+
+    compact_params = Model.ffm_to_compact(FFM_pretrain_params, feature_fields)
+    torch.save(compact_params, args.save_param_dir + args.campaign_id + 'CompactFFMbest.pth')
+
+    print('FFM parameters', sum(v.numel() for v in FFM_pretrain_params.values()),
+          '-> CompactFFM parameters', sum(v.numel() for v in compact_params.values()))
@@ -41,10 +41,10 @@ def get_dataset(datapath, dataset_name, campaign_id, valid_day, test_day):
     data_file_name = 'train.txt'
     day_index_file_name = 'day_index.csv'
 
-    train_fm = pd.read_csv(data_path + data_file_name, header=None).values.astype(int)
+    train_fm = Data.load_encoded_data(data_path + data_file_name)
 
     field_nums = len(train_fm[0, 1:]) # 特征域的数量
-    feature_nums = np.max(train_fm[:, 1:].flatten()) + 1 # 特征数量
+    feature_nums = Data.load_feature_nums(data_path) # 特征数量
 
     day_indexs = pd.read_csv(data_path + day_index_file_name, header=None).values
     days = day_indexs[:, 0] # 数据集中有的日期
@@ -52,32 +52,12 @@ def get_dataset(datapath, dataset_name, campaign_id, valid_day, test_day):
     days_list.pop(days_list.index(valid_day))
     days_list.pop(days_list.index(test_day))
 
-    train_data = np.array([])
-    for i, day in enumerate(days_list): # 生成训练集
-        current_day_index = day_indexs[days == day]
-        data_index_start = current_day_index[0, 1]
-        data_index_end = current_day_index[0, 2] + 1
+    # 训练, 验证, 测试集都只是train_fm上的行区间, 不复制数据
+    train_ranges = Data.day_ranges(day_indexs, days_list)
+    valid_ranges = Data.day_ranges(day_indexs, [valid_day])
+    test_ranges = Data.day_ranges(day_indexs, [test_day])
 
-        data_ = train_fm[data_index_start: data_index_end, :]
-        if i == 0:
-            train_data = data_
-        else:
-            train_data = np.concatenate((train_data, data_), axis=0)
-
-    # 生成验证集
-    valid_day_index = day_indexs[days == valid_day]
-    valid_index_start = valid_day_index[0, 1]
-    valid_index_end = valid_day_index[0, 2] + 1
-
-    valid_data = train_fm[valid_index_start: valid_index_end, :]
-
-    # 生成测试集
-    test_day_index = day_indexs[days == test_day]
-    test_index_start = test_day_index[0, 1]
-    test_index_end = test_day_index[0, 2] + 1
-    test_data = train_fm[test_index_start: test_index_end, :]
-
-    return train_fm, day_indexs, train_data, valid_data, test_data, field_nums, feature_nums
+    return train_fm, day_indexs, train_ranges, valid_ranges, test_ranges, field_nums, feature_nums
 
 
 # def generate_preds(model_dict, features, actions, prob_weights, labels, device, mode):
@@ -215,9 +195,8 @@ def generate_preds(model_dict, features, actions, prob_weights, labels, device,
 
     return_prob_weights = torch.zeros(size=[len(features), pretrain_model_len]).to(device)
 
-    pretrain_y_preds = {}
-    for i in range(pretrain_model_len):
-        pretrain_y_preds[i] = model_dict[i](features).detach()
+    ensemble_y_preds = model_dict(features)
+    pretrain_y_preds = {i: ensemble_y_preds[:, i: i + 1] for i in range(pretrain_model_len)}
 
     choose_model_lens = range(2, pretrain_model_len + 1)
     for i in choose_model_lens: # 根据ddqn_model的action,判断要选择ensemble的数量
@@ -302,8 +281,8 @@ def train(ddqn_model, ddpg_for_pg_model, model_dict, data_loader, ou_noise_obj,
     total_loss = 0
     log_intervals = 0
     total_rewards = 0
-    for i, (features, labels) in enumerate(tqdm.tqdm(data_loader, smoothing=0, mininterval=1.0)):
-        features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+    for i, (features, labels) in enumerate(tqdm.tqdm(Data.device_prefetcher(data_loader, device, report=True), smoothing=0, mininterval=1.0)):
+        labels = torch.unsqueeze(labels, 1)
         actions = ddqn_model.choose_action(features, exploration_rate)
 
         prob_weights = ddpg_for_pg_model.choose_action(features, actions.float(), exploration_rate)
@@ -337,8 +316,8 @@ def test(ddqn_model, ddpg_for_pg_model, model_dict, data_loader, loss, device):
     intervals = 0
     total_test_loss = 0
     with torch.no_grad():
-        for i, (features, labels) in enumerate(data_loader):
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for i, (features, labels) in enumerate(Data.device_prefetcher(data_loader, device)):
+            labels = torch.unsqueeze(labels, 1)
             actions = ddqn_model.choose_best_action(features)
             prob_weights = ddpg_for_pg_model.choose_best_action(features, actions.float())
 
@@ -360,8 +339,8 @@ def test(ddqn_model, ddpg_for_pg_model, model_dict, data_loader, loss, device):
 def submission(ddqn_model, ddpg_for_pg_model, model_dict, data_loader, device):
     targets, predicts = list(), list()
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             actions = ddqn_model.choose_best_action(features)
             prob_weights = ddpg_for_pg_model.choose_best_action(features, actions.float())
             y, prob_weights_new, rewards = generate_preds(model_dict, features, actions, prob_weights, labels, device, mode='test')
@@ -378,15 +357,11 @@ def main(data_path, dataset_name, campaign_id, valid_day, test_day, latent_dims,
         os.mkdir(save_param_dir)
 
     device = torch.device(device) # 指定运行设备
-    train_fm, day_indexs, train_data, valid_data, test_data, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id, valid_day, test_day)
-
-    train_dataset = Data.libsvm_dataset(train_data[:, 1:], train_data[:, 0])
-    valid_dataset = Data.libsvm_dataset(valid_data[:, 1:], valid_data[:, 0])
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
+    train_fm, day_indexs, train_ranges, valid_ranges, test_ranges, field_nums, feature_nums = get_dataset(data_path, dataset_name, campaign_id, valid_day, test_day)
 
-    train_data_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, num_workers=8)
-    valid_data_loader = torch.utils.data.DataLoader(valid_dataset, batch_size=batch_size, num_workers=8)
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    train_data_loader = Data.libsvm_range_dataset(train_fm, train_ranges, batch_size=batch_size)
+    valid_data_loader = Data.libsvm_range_dataset(train_fm, valid_ranges, batch_size=batch_size)
+    test_data_loader = Data.libsvm_range_dataset(train_fm, test_ranges, batch_size=batch_size)
 
     # FFM = p_model.FFM(feature_nums, field_nums, latent_dims)
     # FFM_pretain_params = torch.load('models/model_params/' + campaign_id + 'FFMbest.pth')
@@ -427,6 +402,7 @@ def main(data_path, dataset_name, campaign_id, valid_day, test_day, latent_dims,
     DCN.eval()
 
     model_dict = {0: IPNN.to(device), 1: WandD.to(device), 2: DeepFM.to(device), 3: FNN.to(device), 4: DCN.to(device)}
+    model_dict = p_model.FusedEnsemble(model_dict)
     # model_dict = {0: DeepFM.to(device), 1: WandD.to(device), 2: FFM.to(device),
     #               3: FNN.to(device)}
 
@@ -434,7 +410,7 @@ def main(data_path, dataset_name, campaign_id, valid_day, test_day, latent_dims,
     #
     model_dict_len = len(model_dict)
 
-    memory_size = round(len(train_data), -6)
+    memory_size = round(train_data_loader.rows, -6)
     ddqn_model, ddpg_for_pg_model = get_model(model_dict_len, feature_nums, field_nums, latent_dims, batch_size, memory_size, device, campaign_id)
 
     loss = nn.BCELoss()
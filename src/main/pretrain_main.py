@@ -29,6 +29,8 @@ def get_model(model_name, feature_nums, field_nums, latent_dims):
         return Model.FM(feature_nums, latent_dims)
     elif model_name == 'FFM':
         return Model.FFM(feature_nums, field_nums, latent_dims)
+    elif model_name == 'CompactFFM':
+        return Model.CompactFFM(feature_nums, field_nums, latent_dims)
     elif model_name == 'W&D':
         return Model.WideAndDeep(feature_nums, field_nums, latent_dims)
     elif model_name == 'DeepFM':
@@ -49,10 +51,10 @@ def get_dataset(datapath, dataset_name, campaign_id, valid_day, test_day):
     data_file_name = 'train.txt'
     day_index_file_name = 'day_index.csv'
 
-    train_fm = pd.read_csv(data_path + data_file_name, header=None).values.astype(int)
+    train_fm = Data.load_encoded_data(data_path + data_file_name)
 
     field_nums = len(train_fm[0, 1:])  # 特征域的数量
-    feature_nums = np.max(train_fm[:, 1:].flatten()) + 1  # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
     day_indexs = pd.read_csv(data_path + day_index_file_name, header=None).values
     days = day_indexs[:, 0]  # 数据集中有的日期
@@ -60,40 +62,20 @@ def get_dataset(datapath, dataset_name, campaign_id, valid_day, test_day):
     days_list.pop(days_list.index(valid_day))
     days_list.pop(days_list.index(test_day))
 
-    train_data = np.array([])
-    for i, day in enumerate(days_list):  # 生成训练集
-        current_day_index = day_indexs[days == day]
-        data_index_start = current_day_index[0, 1]
-        data_index_end = current_day_index[0, 2] + 1
+    # 训练, 验证, 测试集都只是train_fm上的行区间, 不复制数据
+    train_ranges = Data.day_ranges(day_indexs, days_list)
+    valid_ranges = Data.day_ranges(day_indexs, [valid_day])
+    test_ranges = Data.day_ranges(day_indexs, [test_day])
 
-        data_ = train_fm[data_index_start: data_index_end, :]
-        if i == 0:
-            train_data = data_
-        else:
-            train_data = np.concatenate((train_data, data_), axis=0)
-
-    # 生成验证集
-    valid_day_index = day_indexs[days == valid_day]
-    valid_index_start = valid_day_index[0, 1]
-    valid_index_end = valid_day_index[0, 2] + 1
-
-    valid_data = train_fm[valid_index_start: valid_index_end, :]
-
-    # 生成测试集
-    test_day_index = day_indexs[days == test_day]
-    test_index_start = test_day_index[0, 1]
-    test_index_end = test_day_index[0, 2] + 1
-    test_data = train_fm[test_index_start: test_index_end, :]
-
-    return train_fm, day_indexs, train_data, valid_data, test_data, field_nums, feature_nums
+    return train_fm, day_indexs, train_ranges, valid_ranges, test_ranges, field_nums, feature_nums
 
 
 def train(model, optimizer, data_loader, loss, device):
     model.train()  # 转换为训练模式
     total_loss = 0
     log_intervals = 0
-    for i, (features, labels) in enumerate(tqdm.tqdm(data_loader, smoothing=0, mininterval=1.0) ):
-        features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+    for i, (features, labels) in enumerate(tqdm.tqdm(Data.device_prefetcher(data_loader, device, report=True), smoothing=0, mininterval=1.0) ):
+        labels = torch.unsqueeze(labels, 1)
         y = model(features)
         train_loss = loss(y, labels.float())
 
@@ -107,15 +89,16 @@ def train(model, optimizer, data_loader, loss, device):
     return total_loss / log_intervals
 
 
-def test(model, data_loader, loss, device):
+def test(model, data_loader, loss, device, neg_rate=1.0):
     model.eval()
     targets, predicts = list(), list()
     intervals = 0
     total_test_loss = 0
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             y = model(features)
+            y = Data.calibrate_preds(y, neg_rate)
 
             test_loss = loss(y, labels.float())
             targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
@@ -129,8 +112,8 @@ def test(model, data_loader, loss, device):
 def submission(model, data_loader, device):
     targets, predicts = list(), list()
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             y = model(features)
 
             targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
@@ -140,23 +123,23 @@ def submission(model, data_loader, device):
 
 
 def main(data_path, dataset_name, campaign_id, valid_day, test_day, latent_dims, model_name, epoch, learning_rate,
-         weight_decay, early_stop_type, batch_size, device, save_param_dir):
+         weight_decay, early_stop_type, batch_size, device, save_param_dir, neg_rate=1.0):
     if not os.path.exists(save_param_dir + campaign_id):
         os.mkdir(save_param_dir + campaign_id)
 
     device = torch.device(device)  # 指定运行设备
-    train_fm, day_indexs, train_data, valid_data, test_data, field_nums, feature_nums = get_dataset(data_path,
-                                                                                                    dataset_name,
-                                                                                                    campaign_id,
-                                                                                                    valid_day, test_day)
-
-    train_dataset = Data.libsvm_dataset(train_data[:, 1:], train_data[:, 0])
-    valid_dataset = Data.libsvm_dataset(valid_data[:, 1:], valid_data[:, 0])
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
-
-    train_data_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, num_workers=8)
-    valid_data_loader = torch.utils.data.DataLoader(valid_dataset, batch_size=batch_size, num_workers=8)
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    train_fm, day_indexs, train_ranges, valid_ranges, test_ranges, field_nums, feature_nums = get_dataset(data_path,
+                                                                                                          dataset_name,
+                                                                                                          campaign_id,
+                                                                                                          valid_day, test_day)
+
+    if neg_rate < 1:
+        train_data = Data.downsample_train(train_fm, neg_rate, ranges=train_ranges)
+        train_data_loader = Data.libsvm_batch_dataset(train_data[:, 1:], train_data[:, 0], batch_size=batch_size)
+    else:
+        train_data_loader = Data.libsvm_range_dataset(train_fm, train_ranges, batch_size=batch_size)
+    valid_data_loader = Data.libsvm_range_dataset(train_fm, valid_ranges, batch_size=batch_size)
+    test_data_loader = Data.libsvm_range_dataset(train_fm, test_ranges, batch_size=batch_size)
 
     model = get_model(model_name, feature_nums, field_nums, latent_dims).to(device)
 
@@ -184,7 +167,7 @@ def main(data_path, dataset_name, campaign_id, valid_day, test_day, latent_dims,
 
         torch.save(model.state_dict(), save_param_dir + campaign_id + model_name + str(np.mod(epoch_i, 5)) + '.pth')
 
-        auc, valid_loss = test(model, valid_data_loader, loss, device)
+        auc, valid_loss = test(model, valid_data_loader, loss, device, neg_rate)
         valid_aucs.append(auc)
         valid_losses.append(valid_loss)
 
@@ -207,6 +190,8 @@ def main(data_path, dataset_name, campaign_id, valid_day, test_day, latent_dims,
     else:
         test_model = model
 
+    Model.fold_calibration(test_model, neg_rate)
+
     auc, test_loss = test(test_model, test_data_loader, loss, device)
     torch.save(test_model.state_dict(), save_param_dir + campaign_id + model_name + 'best.pth')  # 存储最优参数
 
@@ -258,7 +243,7 @@ if __name__ == '__main__':
     parser.add_argument('--valid_day', default=11, help='6, 7, 8, 9, 10, 11, 12')
     parser.add_argument('--test_day', default=12, help='6, 7, 8, 9, 10, 11, 12')
     parser.add_argument('--campaign_id', default='1458/', help='1458, 3358, 3386, 3427, 3476')
-    parser.add_argument('--model_name', default='AFM', help='LR, FM, FFM, W&D, FNN, DeepFM, IPNN, OPNN, DCN, AFM')
+    parser.add_argument('--model_name', default='AFM', help='LR, FM, FFM, CompactFFM, W&D, FNN, DeepFM, IPNN, OPNN, DCN, AFM')
     parser.add_argument('--latent_dims', default=8)
     parser.add_argument('--epoch', type=int, default=100)
     parser.add_argument('--learning_rate', type=float, default=1e-4)
@@ -267,6 +252,7 @@ if __name__ == '__main__':
     parser.add_argument('--batch_size', type=int, default=2048)
     parser.add_argument('--device', default='cuda:0')
     parser.add_argument('--save_param_dir', default='../models/model_params/')
+    parser.add_argument('--neg_rate', type=float, default=1.0, help='负样本降采样的保留比例, 1为不降采样')
 
     args = parser.parse_args()
 
@@ -287,5 +273,6 @@ if __name__ == '__main__':
         args.early_stop_type,
         args.batch_size,
         args.device,
-        args.save_param_dir
+        args.save_param_dir,
+        args.neg_rate
     )
\ No newline at end of file
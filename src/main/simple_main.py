@@ -32,10 +32,10 @@ def get_dataset(datapath, dataset_name, campaign_id, valid_day, test_day):
     data_file_name = 'train.txt'
     day_index_file_name = 'day_index.csv'
 
-    train_fm = pd.read_csv(data_path + data_file_name, header=None).values.astype(int)
+    train_fm = Data.load_encoded_data(data_path + data_file_name)
 
     field_nums = len(train_fm[0, 1:])  # 特征域的数量
-    feature_nums = np.max(train_fm[:, 1:].flatten()) + 1  # 特征数量
+    feature_nums = Data.load_feature_nums(data_path)  # 特征数量
 
     day_indexs = pd.read_csv(data_path + day_index_file_name, header=None).values
     days = day_indexs[:, 0]  # 数据集中有的日期
@@ -43,32 +43,12 @@ def get_dataset(datapath, dataset_name, campaign_id, valid_day, test_day):
     days_list.pop(days_list.index(valid_day))
     days_list.pop(days_list.index(test_day))
 
-    train_data = np.array([])
-    for i, day in enumerate(days_list):  # 生成训练集
-        current_day_index = day_indexs[days == day]
-        data_index_start = current_day_index[0, 1]
-        data_index_end = current_day_index[0, 2] + 1
+    # 训练, 验证, 测试集都只是train_fm上的行区间, 不复制数据
+    train_ranges = Data.day_ranges(day_indexs, days_list)
+    valid_ranges = Data.day_ranges(day_indexs, [valid_day])
+    test_ranges = Data.day_ranges(day_indexs, [test_day])
 
-        data_ = train_fm[data_index_start: data_index_end, :]
-        if i == 0:
-            train_data = data_
-        else:
-            train_data = np.concatenate((train_data, data_), axis=0)
-
-    # 生成验证集
-    valid_day_index = day_indexs[days == valid_day]
-    valid_index_start = valid_day_index[0, 1]
-    valid_index_end = valid_day_index[0, 2] + 1
-
-    valid_data = train_fm[valid_index_start: valid_index_end, :]
-
-    # 生成测试集
-    test_day_index = day_indexs[days == test_day]
-    test_index_start = test_day_index[0, 1]
-    test_index_end = test_day_index[0, 2] + 1
-    test_data = train_fm[test_index_start: test_index_end, :]
-
-    return train_fm, day_indexs, train_data, valid_data, test_data, field_nums, feature_nums
+    return train_fm, day_indexs, train_ranges, valid_ranges, test_ranges, field_nums, feature_nums
 
 def reward_functions(y_preds, features, FFM, labels, device):
     FFM_preds = FFM(features.cpu()).to(device).detach()
@@ -104,8 +84,8 @@ def train(model, FFM, data_loader, device, ou_noise_obj, exploration_rate):
     total_loss = 0
     log_intervals = 0
     total_rewards = 0
-    for i, (features, labels) in enumerate(tqdm.tqdm(data_loader, smoothing=0, mininterval=1.0)):
-        features, labels = features.long().to(device), torch.unsqueeze(labels, 1).float().to(device)
+    for i, (features, labels) in enumerate(tqdm.tqdm(Data.device_prefetcher(data_loader, device, report=True), smoothing=0, mininterval=1.0)):
+        labels = torch.unsqueeze(labels, 1).float()
         ou_noise = ou_noise_obj()[:len(features)].reshape(-1, 1)
 
         actions = model.choose_action(features) # ctrs
@@ -136,8 +116,8 @@ def test(model, data_loader, loss, device):
     intervals = 0
     total_test_loss = 0
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             y = torch.FloatTensor(model.choose_action(features)).to(device)
 
             test_loss = loss(y, labels.float())
@@ -152,8 +132,8 @@ def test(model, data_loader, loss, device):
 def submission(model, data_loader, device):
     targets, predicts = list(), list()
     with torch.no_grad():
-        for features, labels in data_loader:
-            features, labels = features.long().to(device), torch.unsqueeze(labels, 1).to(device)
+        for features, labels in Data.device_prefetcher(data_loader, device):
+            labels = torch.unsqueeze(labels, 1)
             y = model.choose_action(features)
 
             targets.extend(labels.tolist())  # extend() 函数用于在列表末尾一次性追加另一个序列中的多个值（用新列表扩展原来的列表）。
@@ -167,20 +147,16 @@ def main(data_path, dataset_name, campaign_id, valid_day, test_day, action_nums,
         os.mkdir(save_param_dir + campaign_id)
 
     device = torch.device(device)  # 指定运行设备
-    train_fm, day_indexs, train_data, valid_data, test_data, field_nums, feature_nums = get_dataset(data_path,
-                                                                                                    dataset_name,
-                                                                                                    campaign_id,
-                                                                                                    valid_day, test_day)
-
-    train_dataset = Data.libsvm_dataset(train_data[:, 1:], train_data[:, 0])
-    valid_dataset = Data.libsvm_dataset(valid_data[:, 1:], valid_data[:, 0])
-    test_dataset = Data.libsvm_dataset(test_data[:, 1:], test_data[:, 0])
+    train_fm, day_indexs, train_ranges, valid_ranges, test_ranges, field_nums, feature_nums = get_dataset(data_path,
+                                                                                                          dataset_name,
+                                                                                                          campaign_id,
+                                                                                                          valid_day, test_day)
 
-    train_data_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, num_workers=8)
-    valid_data_loader = torch.utils.data.DataLoader(valid_dataset, batch_size=batch_size, num_workers=8)
-    test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, num_workers=8)
+    train_data_loader = Data.libsvm_range_dataset(train_fm, train_ranges, batch_size=batch_size)
+    valid_data_loader = Data.libsvm_range_dataset(train_fm, valid_ranges, batch_size=batch_size)
+    test_data_loader = Data.libsvm_range_dataset(train_fm, test_ranges, batch_size=batch_size)
 
-    memory_size = round(len(train_data), -6)
+    memory_size = round(train_data_loader.rows, -6)
     model = get_model(action_nums, feature_nums, field_nums, latent_dims, batch_size, memory_size, device, campaign_id)
     loss = nn.BCELoss()
 
@@ -3,6 +3,8 @@ import torch.nn as nn
 
 import numpy as np
 
+from src.models.p_model import FieldInteraction
+
 # class Feature_Embedding(nn.Module):
 #     def __init__(self, feature_numbers, field_nums, latent_dims, campaign_id):
 #         super(Feature_Embedding, self).__init__()
@@ -37,10 +39,7 @@ class Feature_Embedding(nn.Module):
         self.feature_embedding = nn.Embedding(feature_numbers, latent_dims)
         # nn.init.xavier_uniform_(self.feature_embedding.weight)
 
-        self.row, self.col = list(), list()
-        for i in range(self.field_nums - 1):
-            for j in range(i + 1, self.field_nums):
-                self.row.append(i), self.col.append(j)
+        self.field_interaction = FieldInteraction(self.field_nums)
 
     def load_embedding(self, pretrain_params):
         self.feature_embedding.weight.data.copy_(
@@ -50,8 +49,7 @@ class Feature_Embedding(nn.Module):
 
     def forward(self, x):
         x_second_embedding = self.feature_embedding(x)
-        hadamard_product = torch.mul(x_second_embedding[:, self.row], x_second_embedding[:, self.col])
-        inner_product = torch.sum(hadamard_product, dim=2)
+        inner_product = self.field_interaction.inner_product(x_second_embedding)
 
         embedding_vectors = torch.cat([inner_product,
                                        x_second_embedding.view(-1, self.field_nums * self.latent_dims)], dim=1)
@@ -1,5 +1,114 @@
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+import torch
 import torch.utils.data.dataset as Dataset
 
+class block_matrix(object):
+    '''
+     encode/to_binary.py --format blk写出的分块压缩矩阵: 按行切片或下标数组取数时只解压涉及的块,
+     [:, cols]返回只取这些列的视图(不读数据), np.array()时用多线程并行解压全部的块;
+     每次读块都重新打开文件, 多个读取者(线程或进程)可以同时使用
+    '''
+    def __init__(self, data_file, cols=None, header=None):
+        self.data_file = os.path.splitext(data_file)[0] + '.blk'
+        if header is None:
+            with open(self.data_file + '.json') as f:
+                header = json.load(f)
+        self.header = header
+        self.rows = header['rows']
+        self.block_rows = header['block_rows']
+        self.offsets = header['offsets']
+        self.cols = cols
+        self.cached_block = (None, None)
+
+    @property
+    def shape(self):
+        if self.cols is None:
+            return self.rows, self.header['cols']
+        return (self.rows,) + np.empty((0, self.header['cols']))[:, self.cols].shape[1:]
+
+    def __len__(self):
+        return self.rows
+
+    def read_block(self, block_idx):
+        if self.cached_block[0] == block_idx:
+            return self.cached_block[1]
+
+        with open(self.data_file, 'rb') as f:
+            f.seek(self.offsets[block_idx])
+            block = f.read(self.offsets[block_idx + 1] - self.offsets[block_idx])
+        values = np.frombuffer(zlib.decompress(block), dtype=np.int32).reshape(-1, self.header['cols'])
+        self.cached_block = (block_idx, values)
+
+        return values
+
+    def read_rows(self, start, end):
+        if start >= end:
+            return np.empty((0, self.header['cols']), dtype=np.int32)
+
+        blocks = [self.read_block(block_idx)
+                  for block_idx in range(start // self.block_rows, (end - 1) // self.block_rows + 1)]
+        first_row = start // self.block_rows * self.block_rows
+        values = blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis=0)
+
+        return values[start - first_row: end - first_row]
+
+    def read_index(self, index):
+        # 下标数组按所在的块分组, 每个块只解压一次
+        index = np.asarray(index)
+        order = np.argsort(index, kind='stable')
+        sorted_index = index[order]
+        values = np.empty((len(index), self.header['cols']), dtype=np.int32)
+        block_ids = sorted_index // self.block_rows
+        for block_idx in np.unique(block_ids):
+            in_block = block_ids == block_idx
+            values[order[in_block]] = self.read_block(block_idx)[sorted_index[in_block] - block_idx * self.block_rows]
+
+        return values
+
+    def select_cols(self, values):
+        return values if self.cols is None else values[:, self.cols]
+
+    def __getitem__(self, item):
+        rows, cols = item if isinstance(item, tuple) else (item, None)
+        if cols is not None:
+            if not (isinstance(rows, slice) and rows == slice(None)):
+                return self[rows][..., cols]
+            if self.cols is not None:
+                cols = np.arange(self.header['cols'])[self.cols][cols]
+            return block_matrix(self.data_file, cols, self.header)
+
+        if isinstance(rows, slice):
+            start, end, step = rows.indices(self.rows)
+            return self.select_cols(self.read_rows(start, end)[::step] if step > 0 else self.read_index(range(start, end, step)))
+        if np.isscalar(rows):
+            rows = int(rows) + self.rows if rows < 0 else int(rows)
+            return self.select_cols(self.read_rows(rows, rows + 1))[0]
+
+        return self.select_cols(self.read_index(rows))
+
+    def to_numpy(self, worker_nums=os.cpu_count()):
+        # zlib解压时释放GIL, 多线程即可并行
+        readers = [block_matrix(self.data_file, header=self.header) for _ in range(worker_nums)]
+        block_nums = len(self.offsets) - 1
+        with ThreadPool(worker_nums) as pool:
+            blocks = pool.map(lambda block_idx: readers[block_idx % worker_nums].read_block(block_idx), range(block_nums))
+        values = np.concatenate(blocks, axis=0) if blocks else np.empty((0, self.header['cols']), dtype=np.int32)
+
+        return self.select_cols(values)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.to_numpy()
+        return values if dtype is None else values.astype(dtype, copy=False)
+
 class libsvm_dataset(Dataset.Dataset):
     def __init__(self, Data, label):
         super(libsvm_dataset, self).__init__()
@@ -16,4 +125,535 @@ class libsvm_dataset(Dataset.Dataset):
         data = self.Data[item]
         label = self.label[item]
 
-        return data, label
\ No newline at end of file
+        return data, label
+
+class libsvm_batch_dataset(Dataset.Dataset):
+    '''
+     按batch取数的数据集: 每次__getitem__直接切出一整个batch的张量, 没有逐条取样和collate的开销,
+     可以像DataLoader一样直接迭代; shuffle为True时每轮按随机下标gather出每个batch,
+     shuffle_batches为True时只打乱连续batch的顺序
+    '''
+    def __init__(self, Data, label, batch_size, shuffle=False, shuffle_batches=False):
+        super(libsvm_batch_dataset, self).__init__()
+        if shuffle and isinstance(Data, block_matrix):
+            # 随机gather的每个batch几乎涉及所有的块, 打乱时先整体解压到内存, 数据与标签来自同一文件时只解压一次
+            if isinstance(label, block_matrix) and label.data_file == Data.data_file:
+                values = block_matrix(Data.data_file, header=Data.header).to_numpy()
+                Data, label = Data.select_cols(values), label.select_cols(values)
+            else:
+                Data, label = Data.to_numpy(), np.asarray(label)
+
+        # 内存中的数组一次性转为张量, 之后切片都是视图; memmap和block_matrix则按batch读取, 已是张量时直接使用
+        if isinstance(Data, (np.memmap, block_matrix)) or torch.is_tensor(Data):
+            self.Data, self.label = Data, label
+        else:
+            self.Data = torch.from_numpy(np.ascontiguousarray(Data))
+            self.label = torch.from_numpy(np.ascontiguousarray(label))
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.shuffle_batches = shuffle_batches
+        self.indexs = None
+
+    def __len__(self):
+        return (len(self.Data) + self.batch_size - 1) // self.batch_size
+
+    def to_tensor(self, x):
+        return x if torch.is_tensor(x) else torch.from_numpy(np.array(x))
+
+    def __getitem__(self, item):
+        if self.indexs is not None:
+            # gather前先排序, 对memmap是顺序读
+            index = np.sort(self.indexs[item * self.batch_size: (item + 1) * self.batch_size])
+            if torch.is_tensor(self.Data):
+                index = torch.from_numpy(index)
+            return self.to_tensor(self.Data[index]), self.to_tensor(self.label[index])
+
+        start = item * self.batch_size
+        end = start + self.batch_size
+
+        return self.to_tensor(self.Data[start: end]), self.to_tensor(self.label[start: end])
+
+    def __iter__(self):
+        self.indexs = np.random.permutation(len(self.Data)) if self.shuffle else None
+        batch_order = np.random.permutation(len(self)) if self.shuffle_batches else range(len(self))
+        for item in batch_order:
+            yield self[item]
+
+class libsvm_range_dataset(Dataset.Dataset):
+    '''
+     由同一个底层矩阵(通常是memmap)上的若干行区间[(start, end)]组成的数据集, 不拼接也不复制整个划分;
+     按batch迭代, batch落在一个区间内时直接切片, 跨区间时只拼接这一个batch
+    '''
+    def __init__(self, Data, ranges, batch_size):
+        super(libsvm_range_dataset, self).__init__()
+        if isinstance(Data, (np.memmap, block_matrix)) or torch.is_tensor(Data):
+            self.Data = Data
+        else:
+            self.Data = torch.from_numpy(np.ascontiguousarray(Data))
+        self.ranges = ranges
+        self.batch_size = batch_size
+        self.range_offsets = np.cumsum([0] + [end - start for start, end in ranges])
+        self.rows = int(self.range_offsets[-1])
+
+    def __len__(self):
+        return (self.rows + self.batch_size - 1) // self.batch_size
+
+    def to_tensor(self, x):
+        return x if torch.is_tensor(x) else torch.from_numpy(np.array(x))
+
+    def __getitem__(self, item):
+        batch_start = item * self.batch_size
+        batch_end = min(batch_start + self.batch_size, self.rows)
+
+        pieces = []
+        k = np.searchsorted(self.range_offsets, batch_start, side='right') - 1
+        while batch_start < batch_end:
+            range_start, range_end = self.ranges[k]
+            start = range_start + batch_start - self.range_offsets[k]
+            end = min(range_end, start + batch_end - batch_start)
+            pieces.append(self.to_tensor(self.Data[start: end]))
+            batch_start += end - start
+            k += 1
+        items = pieces[0] if len(pieces) == 1 else torch.cat(pieces, dim=0)
+
+        return items[:, 1:], items[:, 0]
+
+    def __iter__(self):
+        for item in range(len(self)):
+            yield self[item]
+
+class libsvm_stream_reader(object):
+    '''
+     流式读取编码后的数据文件: 后台线程每次用pandas的C解析器向量化解析chunk_batches个batch为int32张量
+     (存在同名.npy或.blk时直接从memmap或压缩块中切片), 切成(features, labels)张量后放入有界队列,
+     主循环取数与解析重叠; 用with打开, 退出时停止后台线程.
+     shuffle_buffer大于0时在内存中保留这么多行, 与新读入的chunk合并打乱后输出其余部分,
+     每轮传入不同的seed即可得到不同的顺序, 不需要重新在磁盘上打乱; label_mix()给出打乱效果.
+     数据切成了分片时, 第worker_id个进程只读取属于自己的分片
+    '''
+    def __init__(self, data_file, batch_size, chunk_batches=1024, queue_size=16, shuffle_buffer=0, seed=None,
+                 worker_id=0, worker_nums=1):
+        self.data_files = [shard['path'] for shard in worker_shards(data_file, worker_id, worker_nums)]
+        self.batch_size = batch_size
+        self.chunk_rows = batch_size * chunk_batches  # chunk行数取batch_size的整数倍, batch不会跨chunk
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.batch_positives = []
+
+    def read_file_chunks(self, data_file):
+        npy_file = os.path.splitext(data_file)[0] + '.npy'
+        blk_file = os.path.splitext(data_file)[0] + '.blk'
+        if os.path.exists(npy_file) or os.path.exists(blk_file):
+            data = load_encoded_data(data_file)
+            for start in range(0, len(data), self.chunk_rows):
+                yield np.array(data[start: start + self.chunk_rows])
+        else:
+            for chunk in pd.read_csv(data_file, header=None, dtype=np.int32, chunksize=self.chunk_rows):
+                yield chunk.values
+
+    def read_chunks(self):
+        # 依次读取各个文件, 文件末尾不足一个batch的行并入下一个文件的第一个chunk
+        rest = None
+        for data_file in self.data_files:
+            for chunk in self.read_file_chunks(data_file):
+                if rest is not None:
+                    chunk = np.concatenate([rest, chunk], axis=0)
+                out_rows = len(chunk) // self.batch_size * self.batch_size
+                rest = chunk[out_rows:] if out_rows < len(chunk) else None
+                if out_rows > 0:
+                    yield chunk[:out_rows]
+        if rest is not None:
+            yield rest
+
+    def shuffled_chunks(self):
+        # 缓冲区与新chunk合并后打乱, 输出超出缓冲区大小的部分(取batch_size的整数倍), 读完后输出剩余的全部
+        random_state = np.random.RandomState(self.seed)
+        buffer = None
+        for chunk in self.read_chunks():
+            buffer = chunk if buffer is None else np.concatenate([buffer, chunk], axis=0)
+            buffer = buffer[random_state.permutation(len(buffer))]
+            out_rows = (len(buffer) - self.shuffle_buffer) // self.batch_size * self.batch_size
+            if out_rows > 0:
+                yield buffer[:out_rows]
+                buffer = buffer[out_rows:]
+        if buffer is not None and len(buffer):
+            yield buffer
+
+    def label_mix(self):
+        '''
+         已输出的完整batch的正样本率的标准差, 与完全随机顺序下的期望(二项分布)相比,
+         mix_ratio接近1说明正负样本混合均匀, 远大于1说明正样本仍按文件顺序扎堆
+        '''
+        batch_positives = np.concatenate(self.batch_positives) if self.batch_positives else np.array([])
+        if not len(batch_positives):
+            return {}
+
+        batch_rates = batch_positives / self.batch_size
+        positive_rate = batch_rates.mean()
+        expected_std = np.sqrt(positive_rate * (1 - positive_rate) / self.batch_size)
+        return {
+            'batches': len(batch_rates),
+            'positive_rate': positive_rate,
+            'batch_rate_std': batch_rates.std(),
+            'expected_std': expected_std,
+            'mix_ratio': batch_rates.std() / expected_std if expected_std > 0 else 1.0
+        }
+
+    def put(self, item):
+        # 队列满时等待, 主循环提前退出后不再阻塞
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self):
+        try:
+            chunks = self.shuffled_chunks() if self.shuffle_buffer > 0 else self.read_chunks()
+            for chunk in chunks:
+                full_rows = len(chunk) // self.batch_size * self.batch_size
+                self.batch_positives.append(chunk[:full_rows, 0].reshape(-1, self.batch_size).sum(axis=1))
+
+                items = torch.from_numpy(np.ascontiguousarray(chunk))
+                for start in range(0, len(items), self.batch_size):
+                    batch = items[start: start + self.batch_size]
+                    if not self.put((batch[:, 1:], batch[:, :1])):
+                        return
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+
+    def __enter__(self):
+        self.stop_event.clear()
+        self.batch_positives = []
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.queue.get()
+        if item is None:
+            self.put(None)  # 读完后再次调用next同样抛出StopIteration
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+
+        return item
+
+class device_prefetcher(object):
+    '''
+     把任意按batch产出(features, labels)的数据源包装成预取迭代器: 有GPU时提前把之后prefetch_nums个batch
+     放入锁页内存, 在单独的cuda stream上non_blocking地拷贝到显存, 与计算重叠; 没有GPU时依次.to(device).
+     wait_seconds为主循环等待输入的总时间, report为True时每轮结束打印
+    '''
+    def __init__(self, batches, device, prefetch_nums=2, report=False):
+        self.batches = batches
+        self.device = torch.device(device)
+        self.prefetch_nums = prefetch_nums
+        self.report = report
+        self.use_cuda = self.device.type == 'cuda' and torch.cuda.is_available()
+        self.wait_seconds = 0.0
+
+    def __len__(self):
+        return len(self.batches)
+
+    def to_device(self, tensor):
+        if not self.use_cuda:
+            return tensor.to(self.device)
+
+        if not tensor.is_pinned():
+            tensor = tensor.pin_memory()
+        return tensor.to(self.device, non_blocking=True)
+
+    def stage(self, batch, stream):
+        # 返回拷贝到device上的batch和拷贝完成的事件
+        if not self.use_cuda:
+            return tuple(self.to_device(x) for x in batch), None
+
+        with torch.cuda.stream(stream):
+            batch = tuple(self.to_device(x) for x in batch)
+            event = torch.cuda.Event()
+            event.record(stream)
+        return batch, event
+
+    def __iter__(self):
+        self.wait_seconds = 0.0
+        start_time = time.time()
+        stream = torch.cuda.Stream(device=self.device) if self.use_cuda else None
+        prefetch_nums = self.prefetch_nums if self.use_cuda else 1
+        source = iter(self.batches)
+        staged = collections.deque()
+
+        wait_start_time = time.time()
+        while True:
+            while len(staged) < prefetch_nums:
+                batch = next(source, None)
+                if batch is None:
+                    break
+                staged.append(self.stage(batch, stream))
+            if not staged:
+                break
+
+            batch, event = staged.popleft()
+            if event is not None:
+                current_stream = torch.cuda.current_stream(self.device)
+                current_stream.wait_event(event)
+                for x in batch:
+                    x.record_stream(current_stream)
+            self.wait_seconds += time.time() - wait_start_time
+
+            yield batch
+            wait_start_time = time.time()
+
+        if self.report:
+            total_seconds = time.time() - start_time
+            print('input wait {:.2f}s of {:.2f}s ({:.1%})'.format(
+                self.wait_seconds, total_seconds, self.wait_seconds / total_seconds if total_seconds > 0 else 0.0))
+
+def check_binary_current(data_file, binary_file, header_file):
+    '''
+     文本文件在转换之后又被修改(重新编码, 增量追加等)时, .npy/.blk已经过期, 直接报错而不是用旧数据训练;
+     依据是文本文件的mtime更新, 或头文件中的行数与meta.json记录的行数不同
+    '''
+    if os.path.exists(data_file) and os.path.getmtime(data_file) > os.path.getmtime(binary_file):
+        raise ValueError('{} is newer than {}, run encode/to_binary.py again'.format(data_file, binary_file))
+
+    data_path, data_file_name = os.path.join(os.path.dirname(data_file), ''), os.path.basename(data_file)
+    file_meta = load_current_meta(data_path, data_file_name).get('files', {}).get(data_file_name)
+    if file_meta is not None and os.path.exists(header_file):
+        with open(header_file) as f:
+            header_rows = json.load(f)['rows']
+        if header_rows != file_meta['rows']:
+            raise ValueError('{} has {} rows but meta.json records {}, run encode/to_binary.py again'.format(
+                binary_file, header_rows, file_meta['rows']))
+
+def load_encoded_data(data_file):
+    '''
+     若存在同名的.npy文件则直接内存映射(只读, 无解析过程), 其次是分块压缩的.blk文件(按需解压),
+     否则回退到解析逗号分隔文本;
+     三种情况都是int32, 特征编号只在nn.Embedding查表时才扩展, 内存和拷贝到显存的数据量都是int64的一半
+    '''
+    stem = os.path.splitext(data_file)[0]
+    npy_file = stem + '.npy'
+    if os.path.exists(npy_file):
+        check_binary_current(data_file, npy_file, stem + '.json')
+        return np.load(npy_file, mmap_mode='r')
+
+    blk_file = stem + '.blk'
+    if os.path.exists(blk_file):
+        check_binary_current(data_file, blk_file, blk_file + '.json')
+        return block_matrix(blk_file)
+
+    return pd.read_csv(data_file, header=None, dtype=np.int32).values
+
+def load_eval_dataset(data_file, batch_size, pin_memory=False):
+    '''
+     评估用数据集: 只解析(或内存映射)一次, 以int32张量常驻内存, 之后每次评估按batch切片;
+     pin_memory为True且有GPU时使用锁页内存, 可以non_blocking地拷贝到显存
+    '''
+    items = torch.from_numpy(np.array(load_encoded_data(data_file), dtype=np.int32))
+    if pin_memory and torch.cuda.is_available():
+        items = items.pin_memory()
+
+    return libsvm_batch_dataset(items[:, 1:], items[:, 0], batch_size)
+
+def day_ranges(day_indexs, days):
+    '''
+     根据day_index.csv的内容[日期, 起始行, 结束行]得到若干天数据的行区间[(start, end)], 相邻的区间合并
+    '''
+    ranges = []
+    for day in days:
+        current_day_index = day_indexs[day_indexs[:, 0] == day]
+        start, end = int(current_day_index[0, 1]), int(current_day_index[0, 2]) + 1
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    return ranges
+
+def negative_downsample(Data, neg_rate, seed=1, ranges=None):
+    '''
+     负样本降采样: 保留全部正样本, 负样本以neg_rate的概率保留, 返回保留下来的行(只有这些行被复制);
+     ranges不为None时只在这些行区间内采样. 用降采样数据训练的模型预测时需用calibrate_preds校正
+    '''
+    random_state = np.random.RandomState(seed)
+    block_rows = 1 << 20
+    kept_rows = []
+    for start, end in ranges or [(0, len(Data))]:
+        for block_start in range(start, end, block_rows):
+            block = np.asarray(Data[block_start: min(block_start + block_rows, end)])
+            keep = (block[:, 0] == 1) | (random_state.rand(len(block)) < neg_rate)
+            kept_rows.append(block[keep])
+
+    return np.concatenate(kept_rows, axis=0)
+
+def downsample_train(Data, neg_rate, seed=1, ranges=None):
+    '''
+     训练脚本共用的降采样入口: neg_rate < 1时对训练集做negative_downsample(只复制保留下来的行)并打印降采样后的规模,
+     否则原样返回Data. 训练时的验证用calibrate_preds把预测还原到原始分布, 训练结束后再用p_model.fold_calibration
+     把校正项并入输出层偏置, 之后的测试, submission以及保存的best参数都是原始分布下的点击率
+    '''
+    if neg_rate >= 1:
+        return Data
+
+    train_data = negative_downsample(Data, neg_rate, seed, ranges)
+    print('negative downsampling rate', neg_rate, 'train rows', len(train_data), 'positive rate', train_data[:, 0].mean())
+    return train_data
+
+def calibrate_preds(y, neg_rate):
+    # 把降采样分布下的预测概率还原到原始分布: p = q / (q + (1 - q) / neg_rate), 未降采样时原样返回
+    if neg_rate >= 1:
+        return y
+
+    return y / (y + (1 - y) / neg_rate)
+
+def load_shard_manifest(data_file):
+    '''
+     读取encode/to_shards.py写出的分片清单<stem>.shards.json, 不存在时返回None;
+     与check_binary_current相同, 源文件的mtime或大小与清单中记录的不同时分片已经过期, 直接报错
+    '''
+    manifest_file = os.path.splitext(data_file)[0] + '.shards.json'
+    if not os.path.exists(manifest_file):
+        return None
+
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+
+    if os.path.exists(data_file):
+        source_stat = os.stat(data_file)
+        if manifest.get('mtime') != source_stat.st_mtime or manifest.get('size') != source_stat.st_size:
+            raise ValueError('{} changed after sharding, run encode/to_shards.py again'.format(data_file))
+
+    return manifest
+
+def encoded_data_exists(data_file):
+    stem = os.path.splitext(data_file)[0]
+    return any(os.path.exists(stem + suffix) for suffix in ['.npy', '.blk', '.txt'])
+
+def worker_shards(data_file, worker_id=0, worker_nums=1):
+    '''
+     第worker_id个进程(共worker_nums个)负责的分片列表, 第i个分片属于i % worker_nums号进程,
+     每个分片为{'path', 'start_row', 'rows', 'positives'}; 单进程且完整文件存在时只返回完整文件
+    '''
+    manifest = load_shard_manifest(data_file)
+    if manifest is None or (worker_nums == 1 and encoded_data_exists(data_file)):
+        if worker_nums > 1:
+            raise ValueError('{} is not sharded, run encode/to_shards.py first'.format(data_file))
+        return [{'path': data_file, 'start_row': 0, 'rows': None, 'positives': None}]
+
+    if manifest['shard_nums'] < worker_nums:
+        raise ValueError('{} has {} shards, fewer than {} workers'.format(data_file, manifest['shard_nums'], worker_nums))
+
+    data_dir = os.path.dirname(data_file)
+    return [dict(shard, path=os.path.join(data_dir, shard['file']))
+            for i, shard in enumerate(manifest['shards']) if i % worker_nums == worker_id]
+
+def load_worker_data(data_file, worker_id=0, worker_nums=1):
+    # 本进程负责的各个分片拼接成一个int32矩阵, 分片可以各自转换为.npy或.blk
+    return np.concatenate([np.array(load_encoded_data(shard['path']), dtype=np.int32)
+                           for shard in worker_shards(data_file, worker_id, worker_nums)], axis=0)
+
+def load_feature_fields(data_path, feature_nums, data_file_name='train.txt'):
+    '''
+     每个特征所属的field下标(未出现过的特征为-1): 编号按field连续时由meta.json的区间得到,
+     否则扫描一遍数据文件, 第i列出现过的特征属于第i个field
+    '''
+    feature_fields = np.full(feature_nums, -1, dtype=np.int64)
+    field_offsets = load_field_offsets(data_path)
+    if field_offsets is not None:
+        for i, (offset, size) in enumerate(zip(*field_offsets)):
+            feature_fields[offset: offset + size] = i
+        return feature_fields
+
+    data = load_encoded_data(data_path + data_file_name)
+    for start in range(0, len(data), 1 << 20):
+        block = np.asarray(data[start: start + (1 << 20)])
+        for i in range(1, block.shape[1]):
+            feature_fields[block[:, i]] = i - 1
+
+    return feature_fields
+
+def load_meta(data_path):
+    # 读取编码脚本写出的meta.json(field_nums, feature_nums, 各文件行数等), 不存在时返回空字典
+    meta_file = data_path + 'meta.json'
+    if not os.path.exists(meta_file):
+        return {}
+
+    with open(meta_file) as f:
+        return json.load(f)
+
+def load_current_meta(data_path, file_name):
+    # meta.json比file_name旧时(生成meta.json之后该文件又被重新生成过)其中的信息已经过期, 返回空字典
+    meta_file, data_file = data_path + 'meta.json', data_path + file_name
+    if os.path.exists(meta_file) and os.path.exists(data_file) and \
+            os.path.getmtime(meta_file) < os.path.getmtime(data_file):
+        print('warning: {} is older than {}, ignored'.format(meta_file, data_file))
+        return {}
+
+    return load_meta(data_path)
+
+def load_feature_nums(data_path):
+    '''
+     优先从meta.json读取feature_nums, 否则只读取featindex.txt的最后一行
+    '''
+    meta = load_current_meta(data_path, 'featindex.txt')
+    if 'feature_nums' in meta:
+        return meta['feature_nums']
+
+    with open(data_path + 'featindex.txt', 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        last_line = f.read().decode(errors='ignore').strip().split('\n')[-1]  # 截断处可能落在多字节字符中间
+
+    return int(last_line.split('\t')[1]) + 1
+
+def load_field_nums(data_path, data_file_name):
+    # 优先从meta.json读取field_nums, 否则读取数据文件的第一行
+    meta = load_current_meta(data_path, data_file_name)
+    if 'field_nums' in meta:
+        return meta['field_nums']
+
+    with open(data_path + data_file_name) as f:
+        return len(f.readline().strip().split(',')) - 1
+
+def load_rows(data_path, data_file_name):
+    # 优先从meta.json读取数据文件的行数, 否则数一遍换行符
+    meta = load_current_meta(data_path, data_file_name)
+    if data_file_name in meta.get('files', {}):
+        return meta['files'][data_file_name]['rows']
+
+    rows = 0
+    with open(data_path + data_file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            rows += block.count(b'\n')
+
+    return rows
+
+def load_field_offsets(data_path):
+    '''
+     编码时使用--field_contiguous(或哈希编码)时, 返回每个特征域编号区间的起点与大小两个列表,
+     可用于为每个特征域单独分配embedding; 编号不连续时返回None
+    '''
+    meta = load_current_meta(data_path, 'featindex.txt')
+    if not meta.get('field_contiguous'):
+        return None
+
+    field_ranges = list(meta['field_ranges'].values())
+    field_offsets = [field_range[0] for field_range in field_ranges]
+    field_sizes = [field_range[1] - field_range[0] + 1 for field_range in field_ranges]
+
+    return field_offsets, field_sizes
@@ -1,3 +1,5 @@
+import copy
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -5,6 +7,30 @@ import torch.utils.data
 
 import numpy as np
 
+class FieldInteraction(nn.Module):
+    '''
+     所有field对(i < j)的交叉, 下标作为buffer注册在模块上(不存入state_dict), 随模型一起移动到device上;
+     inner_product先用批量矩阵乘法E·E^T得到field_nums * field_nums的内积矩阵再取上三角,
+     不需要先复制出两份batch_size * n(n-1)/2 * latent_dims的张量
+    '''
+    def __init__(self, field_nums):
+        super(FieldInteraction, self).__init__()
+        self.field_nums = field_nums
+
+        row, col = torch.triu_indices(field_nums, field_nums, offset=1)  # 与按i, j两重循环的顺序相同
+        self.register_buffer('row', row, persistent=False)
+        self.register_buffer('col', col, persistent=False)
+        self.register_buffer('triu_index', row * field_nums + col, persistent=False)
+
+    def inner_product(self, embedding_x):
+        # embedding_x: batch_size * field_nums * latent_dims, 返回batch_size * n(n-1)/2
+        gram = torch.bmm(embedding_x, embedding_x.transpose(1, 2))
+        return gram.view(-1, self.field_nums * self.field_nums)[:, self.triu_index]
+
+    def hadamard_product(self, embedding_x):
+        # 逐元素乘积, 返回batch_size * n(n-1)/2 * latent_dims
+        return embedding_x[:, self.row] * embedding_x[:, self.col]
+
 # 传统的预测点击率模型
 class LR(nn.Module):
     def __init__(self,
@@ -64,7 +90,9 @@ class FFM(nn.Module):
                  output_dim=1):
         super(FFM, self).__init__()
 
+        self.feature_nums = feature_nums
         self.field_nums = field_nums
+        self.latent_dims = latent_dims
 
         self.linear = nn.Embedding(feature_nums, output_dim)
         self.bias = nn.Parameter(torch.zeros((output_dim,)))
@@ -73,32 +101,101 @@ class FFM(nn.Module):
          FFM 每一个field都有一个关于所有特征的embedding矩阵，例如特征age=14，有一个age对应field的隐向量，
          但是相对于country的field有一个其它的隐向量，以此显示出不同field的区别 
        '''
-        self.field_feature_embeddings = nn.ModuleList([
-            nn.Embedding(feature_nums, latent_dims) for _ in range(field_nums)
-        ]) # 相当于建立一个field_nums * feature_nums * latent_dims的三维矩阵
-        # for embedding in self.field_feature_embeddings:
-        #     nn.init.xavier_uniform_(embedding.weight)
+        # 所有field的embedding矩阵合并成一个field_nums * feature_nums * latent_dims的参数, 初始化与nn.Embedding相同
+        self.field_feature_embeddings = nn.Parameter(torch.randn(field_nums, feature_nums, latent_dims))
+
+        self.field_interaction = FieldInteraction(field_nums)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # 兼容旧版本每个field一个nn.Embedding时保存的参数(field_feature_embeddings.0.weight, ...)
+        old_keys = [prefix + 'field_feature_embeddings.{}.weight'.format(i) for i in range(self.field_nums)]
+        if old_keys[0] in state_dict:
+            state_dict[prefix + 'field_feature_embeddings'] = torch.stack([state_dict.pop(key) for key in old_keys])
+
+        super(FFM, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
     def forward(self, x):
         """
-            :param x: Int tensor of size (batch_size, feature_nums, latent_nums)
+            :param x: Int tensor of size (batch_size, field_nums)
             :return: pctrs
         """
-        x_embedding = [self.field_feature_embeddings[i](x) for i in range(self.field_nums)]
-        second_x = list()
-        for i in range(self.field_nums - 1):
-            for j in range(i + 1, self.field_nums):
-                second_x.append(x_embedding[j][:, i] * x_embedding[i][:, j])
-        # 因此预先输入了x，所以这里field的下标就对应了feature的下标，例如下标x_embedding[i][:, j]，假设j=3此时j就已经对应x=[13, 4, 5, 33]中的33
-        # 总共有n(n-1)/2种组合方式，n=self.field_nums
+        # 对每一对field(i, j), 取第j个field的矩阵中第i个特征的隐向量与第i个field的矩阵中第j个特征的隐向量,
+        # 在展平的参数上一次索引取出全部n(n-1)/2对, n=self.field_nums
+        flat_embeddings = self.field_feature_embeddings.view(-1, self.latent_dims)
+        row, col = self.field_interaction.row, self.field_interaction.col
+        left_x = F.embedding(col * self.feature_nums + x[:, row], flat_embeddings)
+        right_x = F.embedding(row * self.feature_nums + x[:, col], flat_embeddings)
 
-        second_x = torch.stack(second_x, dim=1) # torch.stack(), torch.cat() https://blog.csdn.net/excellent_sun/article/details/95175823
+        second_x = torch.sum(left_x * right_x, dim=(1, 2)).unsqueeze(1)
 
-        out = self.bias + torch.sum(self.linear(x), dim=1) + torch.sum(torch.sum(second_x, dim=1), dim=1, keepdim = True)
+        out = self.bias + torch.sum(self.linear(x), dim=1) + second_x
         pctrs = torch.sigmoid(out)
 
         return pctrs
 
+class CompactFFM(nn.Module):
+    '''
+     节省内存的FFM: 特征只会与其它field_nums - 1个field交叉, 它在自己所属field上的隐向量永远不会被读取,
+     因此每个特征只保存field_nums - 1个隐向量, 参数为feature_nums * (field_nums - 1) * latent_dims;
+     第i个field的特征对第j个field的隐向量存放在第j个(j < i)或第j - 1个(j > i)位置, 输出与FFM相同,
+     已有的FFM参数用ffm_to_compact转换
+    '''
+    def __init__(self,
+                 feature_nums,
+                 field_nums,
+                 latent_dims,
+                 output_dim=1):
+        super(CompactFFM, self).__init__()
+
+        self.feature_nums = feature_nums
+        self.field_nums = field_nums
+        self.latent_dims = latent_dims
+
+        self.linear = nn.Embedding(feature_nums, output_dim)
+        self.bias = nn.Parameter(torch.zeros((output_dim,)))
+
+        self.feature_field_embeddings = nn.Parameter(torch.randn(feature_nums, field_nums - 1, latent_dims))
+
+        self.field_interaction = FieldInteraction(field_nums)
+
+    def forward(self, x):
+        # field对(i, j), i < j: 第i个特征对field j的隐向量在位置j - 1, 第j个特征对field i的隐向量在位置i
+        flat_embeddings = self.feature_field_embeddings.view(-1, self.latent_dims)
+        row, col = self.field_interaction.row, self.field_interaction.col
+        left_x = F.embedding(x[:, row] * (self.field_nums - 1) + col - 1, flat_embeddings)
+        right_x = F.embedding(x[:, col] * (self.field_nums - 1) + row, flat_embeddings)
+
+        second_x = torch.sum(left_x * right_x, dim=(1, 2)).unsqueeze(1)
+
+        out = self.bias + torch.sum(self.linear(x), dim=1) + second_x
+        pctrs = torch.sigmoid(out)
+
+        return pctrs
+
+def ffm_to_compact(pretrain_params, feature_fields):
+    """
+        把FFM的参数转换为CompactFFM的参数
+        :param pretrain_params: FFM的state_dict, 例如torch.load('FFMbest.pth'), 新旧两种格式都可以
+        :param feature_fields: 长度为feature_nums, 每个特征所属的field下标, 未出现过的特征为-1
+        :return: 可直接被CompactFFM load_state_dict的参数
+    """
+    compact_params = pretrain_params.copy()
+    if 'field_feature_embeddings' in compact_params:
+        full_weight = compact_params.pop('field_feature_embeddings')
+    else:
+        field_nums = len([key for key in compact_params if key.startswith('field_feature_embeddings.')])
+        full_weight = torch.stack([compact_params.pop('field_feature_embeddings.{}.weight'.format(i))
+                                   for i in range(field_nums)])
+
+    field_nums, feature_nums = full_weight.shape[0], full_weight.shape[1]
+    fields = torch.as_tensor(np.asarray(feature_fields), dtype=torch.long).clamp(min=0).view(-1, 1)
+    slots = torch.arange(field_nums - 1).view(1, -1)
+    other_fields = slots + (slots >= fields).long()  # 第k个位置对应的field, 跳过特征自身所属的field
+
+    compact_params['feature_field_embeddings'] = full_weight[other_fields, torch.arange(feature_nums).view(-1, 1)]
+
+    return compact_params
+
 # 基于深度学习的点击率预测模型
 class WideAndDeep(nn.Module):
     def __init__(self,
@@ -132,16 +229,22 @@ class WideAndDeep(nn.Module):
 
         self.mlp = nn.Sequential(*layers)
 
+    def mlp_input(self, x):
+        embedding_input = self.embedding(x)
+
+        return embedding_input.view(-1, self.field_nums * self.latent_dims)
+
+    def mlp_output(self, x, mlp_out):
+        out = self.bias + torch.sum(self.linear(x), dim=1) + mlp_out
+
+        return torch.sigmoid(out)
+
     def forward(self, x):
         """
         :param x: Int tensor of size (batch_size, feature_nums, latent_nums)
         :return: pctrs
         """
-        embedding_input = self.embedding(x)
-
-        out = self.bias + torch.sum(self.linear(x), dim=1) + self.mlp(embedding_input.view(-1, self.field_nums * self.latent_dims))
-
-        return torch.sigmoid(out)
+        return self.mlp_output(x, self.mlp(self.mlp_input(x)))
 
 class InnerPNN(nn.Module):
     def __init__(self,
@@ -176,28 +279,27 @@ class InnerPNN(nn.Module):
 
         self.mlp = nn.Sequential(*layers)
 
-        self.row, self.col = list(), list()
-        for i in range(self.field_nums - 1):
-            for j in range(i + 1, self.field_nums):
-                self.row.append(i), self.col.append(j)
+        self.field_interaction = FieldInteraction(self.field_nums)
 
-    def forward(self, x):
-        """
-            :param x: Int tensor of size (batch_size, feature_nums, latent_nums)
-            :return: pctrs
-        """
+    def mlp_input(self, x):
         embedding_x = self.feature_embedding(x)
 
-        inner_product_vectors = torch.sum(torch.mul(embedding_x[:, self.row], embedding_x[:, self.col]), dim=2)
+        inner_product_vectors = self.field_interaction.inner_product(embedding_x)
 
         # 內积之和
         cross_term = inner_product_vectors
 
-        cat_x = torch.cat([embedding_x.view(-1, self.field_nums * self.latent_dims), cross_term], dim=1)
+        return torch.cat([embedding_x.view(-1, self.field_nums * self.latent_dims), cross_term], dim=1)
 
-        out = self.mlp(cat_x)
+    def mlp_output(self, x, mlp_out):
+        return torch.sigmoid(mlp_out)
 
-        return torch.sigmoid(out)
+    def forward(self, x):
+        """
+            :param x: Int tensor of size (batch_size, feature_nums, latent_nums)
+            :return: pctrs
+        """
+        return self.mlp_output(x, self.mlp(self.mlp_input(x)))
 
 class OuterPNN(nn.Module):
     def __init__(self,
@@ -312,16 +414,20 @@ class DeepFM(nn.Module):
 
         return out
 
+    def mlp_input(self, x):
+        embedding_x = self.feature_embedding(x)
+
+        return embedding_x.view(-1, self.field_nums * self.latent_dims)
+
+    def mlp_output(self, x, mlp_out):
+        return torch.sigmoid(self.to_fm(x) + mlp_out)
+
     def forward(self, x):
         """
             :param x: Int tensor of size (batch_size, feature_nums, latent_nums)
             :return: pctrs
         """
-        embedding_x = self.feature_embedding(x)
-
-        out = self.to_fm(x) + self.mlp(embedding_x.view(-1, self.field_nums * self.latent_dims))
-
-        return torch.sigmoid(out)
+        return self.mlp_output(x, self.mlp(self.mlp_input(x)))
 
 class FNN(nn.Module):
     def __init__(self,
@@ -362,15 +468,20 @@ class FNN(nn.Module):
             )
         )
 
+    def mlp_input(self, x):
+        embedding_x = self.feature_embedding(x)
+
+        return embedding_x.view(-1, self.field_nums * self.latent_dims)
+
+    def mlp_output(self, x, mlp_out):
+        return torch.sigmoid(mlp_out)
+
     def forward(self, x):
         """
             :param x: Int tensor of size (batch_size, feature_nums, latent_nums)
             :return: pctrs
         """
-        embedding_x = self.feature_embedding(x)
-        out = self.mlp(embedding_x.view(-1, self.field_nums * self.latent_dims))
-
-        return torch.sigmoid(out)
+        return self.mlp_output(x, self.mlp(self.mlp_input(x)))
 
 
 class DCN(nn.Module):
@@ -448,10 +559,7 @@ class AFM(nn.Module):
 
         self.feature_embedding = nn.Embedding(self.feature_nums, self.latent_dims)
 
-        self.row, self.col = list(), list()
-        for i in range(self.field_nums - 1):
-            for j in range(i + 1, self.field_nums):
-                self.row.append(i), self.col.append(j)
+        self.field_interaction = FieldInteraction(self.field_nums)
 
         attention_factor = self.latent_dims
 
@@ -472,7 +580,7 @@ class AFM(nn.Module):
     def forward(self, x):
         embedding_x = self.feature_embedding(x)
 
-        inner_product = torch.mul(embedding_x[:, self.row], embedding_x[:, self.col])
+        inner_product = self.field_interaction.hadamard_product(embedding_x)
 
         attn_scores = F.relu(self.attention_net(inner_product))
         attn_scores = F.softmax(self.attention_softmax(attn_scores), dim=1)
@@ -483,4 +591,215 @@ class AFM(nn.Module):
 
         out = self.bias + torch.sum(self.linear(x), dim=1) + self.fc(attn_output)
 
-        return torch.sigmoid(out)
\ No newline at end of file
+        return torch.sigmoid(out)
+
+def grow_embeddings(model, pretrain_params):
+    """
+        增量编码后feature_nums变大时, 把旧的预训练参数扩展到用新feature_nums构建的model上
+        :param model: 用新的feature_nums构建的模型
+        :param pretrain_params: 旧的state_dict, 例如torch.load('FMbest.pth')
+        :return: 可直接load_state_dict的参数, 已有特征的行保持不变, 新特征的行沿用model自身的初始化
+    """
+    grown_params = pretrain_params.copy()
+    for name, module in model.named_modules():
+        if isinstance(module, nn.Embedding):
+            key = name + '.weight'
+            old_weight = pretrain_params[key]
+            new_weight = module.weight.data.clone().to(old_weight.device)
+            new_weight[:old_weight.shape[0]] = old_weight
+            grown_params[key] = new_weight
+        elif isinstance(module, CompactFFM):
+            key = (name + '.' if name else '') + 'feature_field_embeddings'
+            old_weight = pretrain_params[key]
+            new_weight = module.feature_field_embeddings.data.clone().to(old_weight.device)
+            new_weight[:old_weight.shape[0]] = old_weight
+            grown_params[key] = new_weight
+        elif isinstance(module, FFM):
+            # FFM的field_nums * feature_nums * latent_dims参数沿特征维扩展, 旧版本的参数先合并
+            key = (name + '.' if name else '') + 'field_feature_embeddings'
+            if key in pretrain_params:
+                old_weight = grown_params.pop(key)
+            else:
+                old_keys = [key + '.{}.weight'.format(i) for i in range(module.field_nums)]
+                old_weight = torch.stack([grown_params.pop(old_key) for old_key in old_keys])
+            new_weight = module.field_feature_embeddings.data.clone().to(old_weight.device)
+            new_weight[:, :old_weight.shape[1]] = old_weight
+            grown_params[key] = new_weight
+
+    return grown_params
+
+def fold_calibration(model, neg_rate):
+    """
+        负样本按neg_rate降采样训练后, 把校正项log(neg_rate)加到输出层的偏置上,
+        之后sigmoid的输出即为原始分布下的点击率, 等价于 p = q / (q + (1 - q) / neg_rate)
+        :param model: p_model中的任一模型
+        :param neg_rate: 负样本保留比例, 不小于1时不做任何修改
+    """
+    if neg_rate >= 1:
+        return
+
+    if isinstance(model, DCN):
+        output_bias = model.linear.bias
+    elif hasattr(model, 'bias'):
+        output_bias = model.bias
+    else:
+        output_bias = model.mlp[-1].bias  # IPNN, OPNN, FNN的最后一层
+
+    output_bias.data += np.log(neg_rate)
+
+class SharedEmbedding(nn.Module):
+    '''
+     FusedEnsemble中代替各模型nn.Embedding的模块, 直接返回本次前向已经合并取出的嵌入中属于自己的那几列,
+     各模型会对嵌入做view, 因此复制成连续的张量
+    '''
+    def __init__(self, gathered, group, start, end):
+        super(SharedEmbedding, self).__init__()
+        self.gathered = gathered  # FusedEnsemble每次前向写入的{group: batch_size * field_nums * 合并后的维度}
+        self.group = group
+        self.start = start
+        self.end = end
+
+    def forward(self, x):
+        return self.gathered[self.group][..., self.start: self.end].contiguous()
+
+def mlp_shape(mlp):
+    """
+        W&D, FNN, IPNN, DeepFM的mlp由若干个Linear-ReLU-Dropout加最后一个Linear组成,
+        返回各Linear的输出维度, 其它结构或处于训练模式(Dropout生效)时返回None
+    """
+    if not isinstance(mlp, nn.Sequential) or mlp.training or len(mlp) % 3 != 1:
+        return None
+    for i, layer in enumerate(mlp):
+        if not isinstance(layer, (nn.Linear, nn.ReLU, nn.Dropout)[i % 3]) or (i % 3 == 0 and layer.bias is None):
+            return None
+
+    return tuple(layer.out_features for layer in mlp[::3])
+
+class StackedMLP(nn.Module):
+    '''
+     把结构相同(各层输出维度相同)的多个mlp的参数按模型堆叠, 每层用一次批量矩阵乘法baddbmm同时计算所有模型;
+     第一层的输入维度可能不同, 补零到同一维度会让较窄的模型多做许多乘法, 因此按输入维度分段,
+     输入维度相同的连续几个模型一起计算, mlps应按第一层的输入维度排好序; 只用于推理, Dropout不生效
+    '''
+    def __init__(self, mlps):
+        super(StackedMLP, self).__init__()
+        linears = [mlp[::3] for mlp in mlps]
+        self.mlp_nums = len(mlps)
+        self.layer_nums = len(linears[0])
+
+        input_dims = [linear[0].in_features for linear in linears]
+        self.input_segments = [(m, input_dims.index(input_dims[m]) + input_dims.count(input_dims[m]))
+                               for m in range(self.mlp_nums) if m == input_dims.index(input_dims[m])]
+
+        for k in range(self.layer_nums):
+            weight = torch.stack([linear[k].weight.detach().t() for linear in linears]) if k > 0 else None
+            self.register_buffer('weight_{}'.format(k), weight, persistent=False)
+            self.register_buffer('bias_{}'.format(k),
+                                 torch.stack([linear[k].bias.detach() for linear in linears]).unsqueeze(1),
+                                 persistent=False)
+        for start, end in self.input_segments:
+            self.register_buffer('input_weight_{}'.format(start),
+                                 torch.stack([linear[0].weight.detach().t() for linear in linears[start: end]]),
+                                 persistent=False)
+
+    def forward(self, inputs):
+        """
+            :param inputs: 每个mlp的输入, batch_size * 各自的输入维度
+            :return: mlp数量 * batch_size * 最后一层的输出维度
+        """
+        h = inputs[0].new_empty(self.mlp_nums, len(inputs[0]), self.bias_0.shape[2])
+        for start, end in self.input_segments:
+            torch.baddbmm(self.bias_0[start: end], torch.stack(inputs[start: end]),
+                          getattr(self, 'input_weight_{}'.format(start)), out=h[start: end])
+        for k in range(1, self.layer_nums):
+            h = torch.baddbmm(getattr(self, 'bias_{}'.format(k)), F.relu(h), getattr(self, 'weight_{}'.format(k)))
+
+        return h
+
+class FusedEnsemble(nn.Module):
+    '''
+     多个预训练模型的合并推理: 所有模型的nn.Embedding按行数分组, 同一组的表沿隐向量维拼接成一个权重,
+     每次前向每组只做一次索引, 各模型再从取出的张量中切出自己的嵌入; 内容完全相同的表只保留一份
+     (例如同一个模型在model_dict中出现两次), 各自微调过的FNN, IPNN与FM的表一般不同, 不会合并;
+     拼接后各模型nn.Embedding的权重改为合并权重中对应几列的视图, 原来的表被释放, 嵌入不占双份内存,
+     因此应在load_state_dict与to(device)之后构建; 推理用的副本共享模型的全部参数,
+     len()与下标访问与原来的model_dict相同;
+     stack_mlps为True时, 处于eval模式且mlp结构相同的W&D, FNN, IPNN, DeepFM用StackedMLP一起计算mlp
+    '''
+    def __init__(self, model_dict, stack_mlps=True):
+        super(FusedEnsemble, self).__init__()
+        self.models = [model_dict[i] for i in range(len(model_dict))]
+        self.gathered = {}
+
+        group_tables = {}  # 行数: [嵌入表]
+        replaces = {}  # id(nn.Embedding): (行数, 在组内的下标)
+        for model in self.models:
+            for module in model.modules():
+                if not isinstance(module, nn.Embedding) or id(module) in replaces or module.max_norm is not None:
+                    continue
+                shape = module.weight.shape
+                tables = group_tables.setdefault(shape[0], [])
+                index = next((k for k, table in enumerate(tables)
+                              if table.shape == shape and torch.equal(table, module.weight)), len(tables))
+                if index == len(tables):
+                    tables.append(module.weight.detach())
+                replaces[id(module)] = (shape[0], index)
+
+        memo = {}
+        self.group_nums = len(group_tables)
+        for group, rows in enumerate(list(group_tables)):
+            # 逐组拼接: 取出本组的表后不再持有, 各模块的权重改为视图时原来的表即被释放, 再拼接下一组
+            tables = group_tables.pop(rows)
+            offsets = np.cumsum([0] + [table.shape[1] for table in tables])
+            fused_embedding = torch.cat(tables, dim=1)
+            del tables
+            self.register_buffer('fused_embedding_{}'.format(group), fused_embedding, persistent=False)
+            for model in self.models:
+                for module in model.modules():
+                    if replaces.get(id(module), (None,))[0] == rows:
+                        index = replaces[id(module)][1]
+                        start, end = int(offsets[index]), int(offsets[index + 1])
+                        module.weight.data = fused_embedding[:, start: end]
+                        memo[id(module)] = SharedEmbedding(self.gathered, group, start, end)
+
+        # 其余参数与buffer直接共享, 不复制
+        for model in self.models:
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                memo[id(tensor)] = tensor
+        self.heads = nn.ModuleList([copy.deepcopy(model, memo) for model in self.models])
+
+        shape_heads = {}  # mlp各层的输出维度: [模型下标]
+        for i, model in enumerate(self.models):
+            if stack_mlps and hasattr(model, 'mlp_input') and mlp_shape(model.mlp) is not None:
+                shape_heads.setdefault(mlp_shape(model.mlp), []).append(i)
+        self.stacked_indexs = [sorted(indexs, key=lambda i: self.models[i].mlp[0].in_features)
+                               for indexs in shape_heads.values() if len(indexs) > 1]
+        self.stacked_mlps = nn.ModuleList([StackedMLP([self.models[i].mlp for i in indexs])
+                                           for indexs in self.stacked_indexs])
+
+    def __len__(self):
+        return len(self.models)
+
+    def __getitem__(self, i):
+        return self.models[i]
+
+    @torch.no_grad()
+    def forward(self, x):
+        """
+            :param x: Int tensor of size (batch_size, field_nums)
+            :return: batch_size * 模型数量的点击率矩阵, 第i列为第i个模型的输出
+        """
+        for group in range(self.group_nums):
+            self.gathered[group] = F.embedding(x, getattr(self, 'fused_embedding_{}'.format(group)))
+        y_preds = [None] * len(self.heads)
+        for indexs, stacked_mlp in zip(self.stacked_indexs, self.stacked_mlps):
+            mlp_outs = stacked_mlp([self.heads[i].mlp_input(x) for i in indexs])
+            for k, i in enumerate(indexs):
+                y_preds[i] = self.heads[i].mlp_output(x, mlp_outs[k])
+        for i, head in enumerate(self.heads):
+            if y_preds[i] is None:
+                y_preds[i] = head(x)
+        y_preds = torch.cat(y_preds, dim=1)
+        self.gathered.clear()
+
+        return y_preds